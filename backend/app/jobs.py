@@ -0,0 +1,78 @@
+import logging
+import os
+import traceback
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse
+from app.models import JobRequest
+from app.routes import hand
+from app.utils import validate_characters
+from handwriting.jobs import Job, JobDocument, JobManager
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+jobs = JobManager(hand)
+
+def _progress(request: Request, job: Job) -> dict:
+    """Job progress with the archive's download URL, never the server's output path"""
+    progress = job.progress()
+    progress["output"] = str(request.url_for("download_job_archive", job_id=job.id)) if job.archive else None
+    return progress
+
+@router.post("/jobs")
+async def submit_job(request: JobRequest, http_request: Request):
+    try:
+        documents = []
+        for index, document in enumerate(request.documents):
+            validate_characters(document.text_input)
+            documents.append(JobDocument(
+                name=document.name or f"{index:05d}",
+                lines=document.text_input,
+                styles=document.styles,
+                biases=document.biases,
+                stroke_colors=document.stroke_colors,
+                stroke_widths=document.stroke_widths,
+                as_pdf=document.as_pdf,
+                image_format=document.image_format,
+                image_scale=document.image_scale,
+                seed=document.seed
+            ))
+
+        return _progress(http_request, jobs.submit(documents, archive=request.archive))
+
+    except HTTPException as http_exc:
+        raise http_exc
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    except Exception as e:
+        logger.error(f"Internal Server Error: {e}")
+        logger.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail="Internal server error.")
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, request: Request):
+    try:
+        return _progress(request, jobs.get(job_id))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown job.")
+
+@router.get("/jobs/{job_id}/archive")
+async def download_job_archive(job_id: str):
+    try:
+        job = jobs.get(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown job.")
+
+    if not job.archive:
+        raise HTTPException(status_code=404, detail="The job was not submitted with archive enabled.")
+    if job.status != "completed" or not os.path.exists(job.archive_path):
+        raise HTTPException(status_code=409, detail=f"The job is {job.status}, its archive is not ready.")
+    return FileResponse(job.archive_path, media_type="application/zip", filename=f"{job.id}.zip")
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str, request: Request):
+    try:
+        return _progress(request, jobs.cancel(job_id))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown job.")
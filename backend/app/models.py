@@ -1,6 +1,22 @@
-from pydantic import BaseModel, Field, conint, confloat, validator
+from pydantic import BaseModel, Field, conint, confloat, conlist, constr, validator
 from typing import List, Optional
 
+MAX_SEED = 2**31 - 2
+PAGE_SIZES = ('a4', 'a5', 'letter', 'legal')
+IMAGE_FORMATS = ('png', 'webp')
+MAX_JOB_DOCUMENTS = 10000
+
+class PageLayout(BaseModel):
+    size: str = Field('a4')
+    margin: confloat(ge=0, le=144) = Field(36)
+    lines_per_page: Optional[conint(ge=1, le=200)] = Field(None)
+
+    @validator('size')
+    def check_page_size(cls, v):
+        if v not in PAGE_SIZES:
+            raise ValueError(f'size must be one of {", ".join(PAGE_SIZES)}')
+        return v
+
 class DetailedHandwritingRequest(BaseModel):
     text_input: List[str]
     styles: List[conint(ge=0, le=12)]
@@ -8,6 +24,16 @@ class DetailedHandwritingRequest(BaseModel):
     stroke_widths: List[conint(ge=1, le=5)]
     stroke_colors: List[str]
     as_pdf: Optional[bool] = Field(False)
+    seed: Optional[conint(ge=0, le=MAX_SEED)] = Field(None)
+    pages: Optional[PageLayout] = Field(None)
+    image_format: Optional[str] = Field(None)
+    image_scale: Optional[confloat(ge=0.25, le=4)] = Field(1.0)
+
+    @validator('image_format')
+    def check_image_format(cls, v):
+        if v is not None and v not in IMAGE_FORMATS:
+            raise ValueError(f'image_format must be one of {", ".join(IMAGE_FORMATS)}')
+        return v
 
     @validator('text_input')
     def check_non_empty_text_input(cls, v):
@@ -22,6 +48,16 @@ class SimpleHandwritingRequest(BaseModel):
     stroke_width: conint(ge=1, le=5)
     stroke_color: str
     as_pdf: Optional[bool] = Field(False)
+    seed: Optional[conint(ge=0, le=MAX_SEED)] = Field(None)
+    pages: Optional[PageLayout] = Field(None)
+    image_format: Optional[str] = Field(None)
+    image_scale: Optional[confloat(ge=0.25, le=4)] = Field(1.0)
+
+    @validator('image_format')
+    def check_image_format(cls, v):
+        if v is not None and v not in IMAGE_FORMATS:
+            raise ValueError(f'image_format must be one of {", ".join(IMAGE_FORMATS)}')
+        return v
 
     @validator('text_input')
     def check_non_empty_text_input(cls, v):
@@ -35,9 +71,84 @@ class StreamHandwritingRequest(BaseModel):
     bias: confloat(ge=0.15, le=2.5)
     stroke_width: conint(ge=1, le=5)
     stroke_color: str
+    seed: Optional[conint(ge=0, le=MAX_SEED)] = Field(None)
+    incremental: Optional[bool] = Field(False)
 
     @validator('text_input')
     def check_non_empty_text_input(cls, v):
         if not v.strip():
             raise ValueError('text_input must not be empty or contain only whitespace')
         return v
+
+class RestyleRequest(BaseModel):
+    handle: str
+    stroke_widths: List[conint(ge=1, le=5)]
+    stroke_colors: List[str]
+    as_pdf: Optional[bool] = Field(False)
+    image_format: Optional[str] = Field(None)
+    image_scale: Optional[confloat(ge=0.25, le=4)] = Field(1.0)
+
+    @validator('image_format')
+    def check_image_format(cls, v):
+        if v is not None and v not in IMAGE_FORMATS:
+            raise ValueError(f'image_format must be one of {", ".join(IMAGE_FORMATS)}')
+        return v
+
+class JobDocumentRequest(BaseModel):
+    name: Optional[constr(regex=r'^[A-Za-z0-9][A-Za-z0-9._-]{0,99}$')] = Field(None)
+    text_input: List[str]
+    styles: List[conint(ge=0, le=12)]
+    biases: List[confloat(ge=0.15, le=2.5)]
+    stroke_widths: List[conint(ge=1, le=5)]
+    stroke_colors: List[str]
+    as_pdf: Optional[bool] = Field(False)
+    seed: Optional[conint(ge=0, le=MAX_SEED)] = Field(None)
+    image_format: Optional[str] = Field(None)
+    image_scale: Optional[confloat(ge=0.25, le=4)] = Field(1.0)
+
+    @validator('image_format')
+    def check_image_format(cls, v):
+        if v is not None and v not in IMAGE_FORMATS:
+            raise ValueError(f'image_format must be one of {", ".join(IMAGE_FORMATS)}')
+        return v
+
+    @validator('text_input')
+    def check_non_empty_text_input(cls, v):
+        if not v or any(text.strip() == "" for text in v):
+            raise ValueError('text_input must not be empty or contain empty strings')
+        return v
+
+    @validator('styles', 'biases', 'stroke_widths', 'stroke_colors')
+    def check_one_per_line(cls, v, values, field):
+        if 'text_input' in values and len(v) != len(values['text_input']):
+            raise ValueError(f'{field.name} must have one entry per line of text_input')
+        return v
+
+class JobRequest(BaseModel):
+    documents: conlist(JobDocumentRequest, min_items=1, max_items=MAX_JOB_DOCUMENTS)
+    archive: Optional[bool] = Field(False)
+
+class SessionSettings(BaseModel):
+    # a null style or seed switches back to unstyled or random sampling
+    style: Optional[conint(ge=0, le=12)]
+    bias: Optional[confloat(ge=0.15, le=2.5)]
+    stroke_width: Optional[conint(ge=1, le=5)]
+    stroke_color: Optional[str]
+    seed: Optional[conint(ge=0, le=MAX_SEED)]
+
+    @validator('bias', 'stroke_width', 'stroke_color', pre=True)
+    def check_not_null(cls, v, field):
+        if v is None:
+            raise ValueError(f'{field.name} cannot be null')
+        return v
+
+class SessionLineEdit(BaseModel):
+    type: str
+    index: conint(ge=0)
+    text: Optional[str] = Field("")
+
+    @validator('type')
+    def check_edit_type(cls, v):
+        if v not in ('insert', 'edit', 'delete'):
+            raise ValueError('type must be one of insert, edit, delete')
+        return v
@@ -1,47 +1,89 @@
 import logging
 import traceback
-from io import BytesIO
 import json
-from typing import Dict
-from fastapi import APIRouter, HTTPException, UploadFile, File
+from typing import Dict, Optional
+from fastapi import APIRouter, HTTPException, UploadFile, File, Header
 from fastapi.responses import StreamingResponse
-from app.models import DetailedHandwritingRequest, SimpleHandwritingRequest, StreamHandwritingRequest
+from app.models import DetailedHandwritingRequest, SimpleHandwritingRequest, StreamHandwritingRequest, RestyleRequest
 from app.utils import split_text_to_segments, validate_characters
 from handwriting.generator import Hand
+import handwriting.utils.raster_utils as raster_utils
+import handwriting.utils.stroke_frames as stroke_frames
 import time
 
+DOCUMENT_HANDLE_HEADER = "X-Document-Handle"
+RESPONSE_CHUNK_SIZE = 64 * 1024
+
 logger = logging.getLogger(__name__)
 router = APIRouter()
 hand = Hand()
 
+def _paginated_response(request, lines, styles, biases, stroke_widths, stroke_colors) -> StreamingResponse:
+    if request.image_format is not None:
+        raise HTTPException(status_code=400, detail="image_format cannot be combined with pages, which are always PDF.")
+    pages = hand.write_pages(
+        lines=lines,
+        styles=styles,
+        biases=biases,
+        stroke_widths=stroke_widths,
+        stroke_colors=stroke_colors,
+        seed=request.seed,
+        page_size=request.pages.size,
+        margin=request.pages.margin,
+        lines_per_page=request.pages.lines_per_page or 0
+    )
+    headers = {"Content-Disposition": "attachment; filename=handwriting.pdf"}
+    return StreamingResponse(pages, media_type="application/pdf", headers=headers)
+
+def _document_response(chunks, handle: str, as_pdf: bool, image_format: Optional[str] = None) -> StreamingResponse:
+    headers = {DOCUMENT_HANDLE_HEADER: handle}
+    if image_format:
+        return StreamingResponse(chunks, media_type=raster_utils.IMAGE_MEDIA_TYPES[image_format], headers=headers)
+    if as_pdf:
+        headers["Content-Disposition"] = "attachment; filename=handwriting.pdf"
+        return StreamingResponse(chunks, media_type="application/pdf", headers=headers)
+    return StreamingResponse(chunks, media_type="image/svg+xml", headers=headers)
+
+def _buffer_chunks(buffer, chunk_size: int = RESPONSE_CHUNK_SIZE):
+    """Iterate over a filled BytesIO in chunks, without copying it whole"""
+    view = buffer.getbuffer()
+    try:
+        for start in range(0, len(view), chunk_size):
+            yield bytes(view[start:start + chunk_size])
+    finally:
+        view.release()
+
 @router.post("/generate")
 async def generate_detailed_handwriting(request: DetailedHandwritingRequest):
     start_time = time.time()
     try:
         validate_characters(request.text_input)
 
-        output = await hand.write(
+        if request.pages is not None:
+            return _paginated_response(
+                request, request.text_input, request.styles, request.biases, request.stroke_widths, request.stroke_colors
+            )
+
+        chunks, handle = hand.write_chunks(
             lines=request.text_input,
             styles=request.styles,
             biases=request.biases,
             stroke_widths=request.stroke_widths,
             stroke_colors=request.stroke_colors,
-            as_pdf=request.as_pdf
+            as_pdf=request.as_pdf,
+            seed=request.seed,
+            image_format=request.image_format,
+            image_scale=request.image_scale
         )
 
-        if request.as_pdf:
-            pdf_stream = BytesIO(output.read())
-            pdf_stream.seek(0)
-            headers = {"Content-Disposition": "attachment; filename=handwriting.pdf"}
-            return StreamingResponse(pdf_stream, media_type="application/pdf", headers=headers)
-        else:
-            svg_stream = BytesIO(output.encode('utf-8'))
-            svg_stream.seek(0)
-            return StreamingResponse(svg_stream, media_type="image/svg+xml")
+        return _document_response(chunks, handle, request.as_pdf, request.image_format)
         
     except HTTPException as http_exc:
         raise http_exc
 
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     except Exception as e:
         logger.error(f"Internal Server Error: {e}")
         logger.error(traceback.format_exc())
@@ -61,28 +103,29 @@ async def generate_simple_handwriting(request: SimpleHandwritingRequest):
         stroke_widths = [request.stroke_width] * len(lines)
         stroke_colors = [request.stroke_color] * len(lines)
 
-        output = await hand.write(
+        if request.pages is not None:
+            return _paginated_response(request, lines, styles, biases, stroke_widths, stroke_colors)
+
+        chunks, handle = hand.write_chunks(
             lines=lines,
             styles=styles,
             biases=biases,
             stroke_widths=stroke_widths,
             stroke_colors=stroke_colors,
-            as_pdf=request.as_pdf
+            as_pdf=request.as_pdf,
+            seed=request.seed,
+            image_format=request.image_format,
+            image_scale=request.image_scale
         )
 
-        if request.as_pdf:
-            pdf_stream = BytesIO(output.read())
-            pdf_stream.seek(0)
-            headers = {"Content-Disposition": "attachment; filename=handwriting.pdf"}
-            return StreamingResponse(pdf_stream, media_type="application/pdf", headers=headers)
-        else:
-            svg_stream = BytesIO(output.encode('utf-8'))
-            svg_stream.seek(0)
-            return StreamingResponse(svg_stream, media_type="image/svg+xml")
+        return _document_response(chunks, handle, request.as_pdf, request.image_format)
         
     except HTTPException as http_exc:
         raise http_exc
 
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     except Exception as e:
         logger.error(f"Internal Server Error: {e}")
         logger.error(traceback.format_exc())
@@ -90,18 +133,43 @@ async def generate_simple_handwriting(request: SimpleHandwritingRequest):
     finally:
         logger.info(f"/generate-simple endpoint took {time.time() - start_time} seconds")
     
+@router.post("/restyle")
+async def restyle_handwriting(request: RestyleRequest):
+    start_time = time.time()
+    try:
+        chunks = hand.restyle_chunks(
+            request.handle,
+            stroke_colors=request.stroke_colors,
+            stroke_widths=request.stroke_widths,
+            as_pdf=request.as_pdf,
+            image_format=request.image_format,
+            image_scale=request.image_scale
+        )
+        return _document_response(chunks, request.handle, request.as_pdf, request.image_format)
+
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown or expired document handle.")
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    except Exception as e:
+        logger.error(f"Internal Server Error: {e}")
+        logger.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail="Internal server error.")
+    finally:
+        logger.info(f"/restyle endpoint took {time.time() - start_time} seconds")
+
 @router.post("/svg-to-pdf")
 async def convert_svg_to_pdf(file: UploadFile = File(...)):
     start_time = time.time()
     try:
         svg_content = await file.read()
 
-        pdf_output = await hand._generate_pdf(svg_content.decode('utf-8'))
+        pdf_output = await hand._generate_pdf(svg_content)
 
-        pdf_stream = BytesIO(pdf_output.read())
-        pdf_stream.seek(0)
         headers = {"Content-Disposition": "attachment; filename=output.pdf"}
-        return StreamingResponse(pdf_stream, media_type="application/pdf", headers=headers)
+        return StreamingResponse(_buffer_chunks(pdf_output), media_type="application/pdf", headers=headers)
 
     except Exception as e:
         logger.error(f"Internal Server Error: {e}")
@@ -111,12 +179,43 @@ async def convert_svg_to_pdf(file: UploadFile = File(...)):
         logger.info(f"/svg-to-pdf endpoint took {time.time() - start_time} seconds")
     
 @router.post("/generate-stream")
-async def stream_handwriting(request: StreamHandwritingRequest):
+async def stream_handwriting(request: StreamHandwritingRequest, accept: Optional[str] = Header(None)):
     start_time = time.time()
     try:
         lines = split_text_to_segments(request.text_input)
         validate_characters(lines)
 
+        if accept and stroke_frames.BINARY_MEDIA_TYPE in accept:
+            async def generate_binary_response():
+                try:
+                    async for frame in hand.stream_write(
+                        lines=lines,
+                        styles=[request.style] * len(lines),
+                        biases=[request.bias] * len(lines),
+                        stroke_colors=[request.stroke_color] * len(lines),
+                        stroke_widths=[request.stroke_width] * len(lines),
+                        seed=request.seed,
+                        incremental=request.incremental,
+                        as_binary=True
+                    ):
+                        yield frame
+
+                except Exception as e:
+                    logger.error(f"Error generating handwriting: {str(e)}")
+                    logger.error(traceback.format_exc())
+                    yield stroke_frames.error_frame(f"Error generating handwriting: {str(e)}")
+                finally:
+                    yield stroke_frames.done_frame()
+
+            return StreamingResponse(
+                generate_binary_response(),
+                media_type=stroke_frames.BINARY_MEDIA_TYPE,
+                headers={
+                    "Cache-Control": "no-cache",
+                    "X-Accel-Buffering": "no"
+                }
+            )
+
         async def generate_streamed_response():
             try:
                 async for chunk in hand.stream_write(
@@ -124,7 +223,9 @@ async def stream_handwriting(request: StreamHandwritingRequest):
                     styles=[request.style] * len(lines),
                     biases=[request.bias] * len(lines),
                     stroke_colors=[request.stroke_color] * len(lines),
-                    stroke_widths=[request.stroke_width] * len(lines)
+                    stroke_widths=[request.stroke_width] * len(lines),
+                    seed=request.seed,
+                    incremental=request.incremental
                 ):
                     if chunk and isinstance(chunk, Dict):
                         try:
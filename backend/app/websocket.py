@@ -0,0 +1,68 @@
+import json
+import logging
+import traceback
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+from app.models import SessionSettings, SessionLineEdit
+from app.routes import hand
+from app.utils import validate_characters
+from handwriting.session import HandwritingSession
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+@router.websocket("/session")
+async def handwriting_session(websocket: WebSocket):
+    await websocket.accept()
+    session = HandwritingSession(hand)
+    try:
+        while True:
+            text = await websocket.receive_text()
+            # a bad message or a failed sample is reported to the client, the session carries on
+            try:
+                message = json.loads(text)
+                if not isinstance(message, dict):
+                    raise ValueError("Messages must be JSON objects")
+                changed = _apply(session, message)
+                for event in await session.render(changed):
+                    await websocket.send_json(event)
+
+            except WebSocketDisconnect:
+                raise
+
+            except HTTPException as http_exc:
+                await websocket.send_json({"type": "error", "message": http_exc.detail})
+
+            except (ValidationError, ValueError, IndexError) as e:
+                await websocket.send_json({"type": "error", "message": str(e)})
+
+            except Exception as e:
+                logger.error(f"Handwriting session message failed: {e}")
+                logger.error(traceback.format_exc())
+                await websocket.send_json({"type": "error", "message": "Failed to render the lines, try again."})
+
+    except WebSocketDisconnect:
+        pass
+
+    except Exception as e:
+        logger.error(f"Handwriting session failed: {e}")
+        logger.error(traceback.format_exc())
+        await websocket.close(code=1011)
+
+    finally:
+        session.close()
+
+def _apply(session: HandwritingSession, message: dict):
+    """Apply one client message to the session, returning the lines to redraw"""
+    if message.get("type") == "configure":
+        settings = SessionSettings(**message.get("settings", {}))
+        return session.configure(**settings.dict(exclude_unset=True))
+
+    edit = SessionLineEdit(**message)
+    if edit.type == "delete":
+        return session.delete(edit.index)
+
+    validate_characters([edit.text])
+    if edit.type == "insert":
+        return session.insert(edit.index, edit.text)
+    return session.edit(edit.index, edit.text)
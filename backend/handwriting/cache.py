@@ -0,0 +1,160 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import numpy as np
+
+from handwriting.config import RESULT_CACHE_CONFIG, CHECKPOINT_DIR
+
+
+class LRUCache:
+    """Thread-safe least-recently-used mapping bounded by the total size of its values in bytes.
+
+    Values larger than the whole budget are not stored.  Hits, misses and evictions are
+    counted and reported by `stats`.
+    """
+
+    def __init__(self, max_bytes: int, sizeof: Callable[[Any], int] = lambda value: value.nbytes):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        size = self.sizeof(value)
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+def model_version(checkpoint_dir: str = CHECKPOINT_DIR) -> str:
+    """Identify the checkpoint the model restores from, so cached strokes are dropped when it changes"""
+    with open(os.path.join(checkpoint_dir, "checkpoint")) as f:
+        match = re.search(r'^model_checkpoint_path:\s*"(.+)"', f.read(), re.MULTILINE)
+    if not match:
+        raise ValueError(f"No checkpoint found in {checkpoint_dir}")
+
+    checkpoint = match.group(1)
+    index_stat = os.stat(os.path.join(checkpoint_dir, f"{checkpoint}.index"))
+    return f"{checkpoint}:{index_stat.st_size}:{int(index_stat.st_mtime)}"
+
+
+class ResultCache:
+    """Sampled strokes of seeded generations, keyed on everything that determines them.
+
+    Entries live in an in-memory LRUCache and, when a directory is given, are also written to
+    disk as .npy files so they survive restarts and can be shared between processes.
+    """
+
+    def __init__(
+        self,
+        version: str,
+        max_bytes: int = RESULT_CACHE_CONFIG["max_bytes"],
+        directory: Optional[str] = RESULT_CACHE_CONFIG["directory"],
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.version = version
+        self.directory = directory
+        self.memory = LRUCache(max_bytes)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def key(self, line: str, style: Optional[int], style_digest: Optional[str], bias: float, seed: int) -> str:
+        """style_digest identifies the contents of the style, so replaced styles do not hit stale entries"""
+        fields = [line, None if style is None else str(style), style_digest, float(bias), int(seed), self.version]
+        return hashlib.sha256(json.dumps(fields).encode("utf-8")).hexdigest()
+
+    def get(self, key: str, load: bool = True) -> Optional[np.ndarray]:
+        """Cached strokes for a key, also looking on disk unless load is False"""
+        strokes = self.memory.get(key)
+        if strokes is None and load:
+            strokes = self._load(key)
+            if strokes is not None:
+                self.memory.put(key, strokes)
+        return strokes
+
+    def put(self, key: str, strokes: np.ndarray) -> None:
+        strokes = np.array(strokes)
+        strokes.setflags(write=False)
+        self.memory.put(key, strokes)
+        self._store(key, strokes)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npy")
+
+    def _load(self, key: str) -> Optional[np.ndarray]:
+        if not self.directory or not os.path.exists(self._path(key)):
+            return None
+        try:
+            strokes = np.load(self._path(key))
+        except Exception as e:
+            self.logger.warning(f"Ignoring unreadable cached strokes {key}: {e}")
+            return None
+        strokes.setflags(write=False)
+        return strokes
+
+    def _store(self, key: str, strokes: np.ndarray) -> None:
+        if not self.directory:
+            return
+        # write then rename so concurrent readers never see a partial file
+        temporary_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporary_path, "wb") as f:
+                np.save(f, strokes)
+            os.replace(temporary_path, self._path(key))
+        except OSError as e:
+            self.logger.warning(f"Failed to persist cached strokes {key}: {e}")
@@ -8,6 +8,7 @@ STYLES_DIR = os.path.join(HANDWRITING_DIR, "styles")
 OUTPUT_DIR = os.path.join(BASE_DIR, "output")
 LOG_DIR = os.path.join(BASE_DIR, "logs")
 PREDICTIONS_DIR = os.path.join(HANDWRITING_DIR, "predictions")
+EXTRA_STYLES_DIRS = [d for d in os.getenv("EXTRA_STYLES_DIRS", "").split(os.pathsep) if d]
 
 MODEL_CONFIG = {
     "learning_rates": [0.0001, 0.00005, 0.00002],
@@ -34,6 +35,91 @@ OUTPUT_CONFIG = {
     "view_width": 1000,
     "default_stroke_width": 2,
     "default_stroke_color": "black",
+    "path_precision": 2,
+    "relative_paths": False,
+}
+
+SCHEDULER_CONFIG = {
+    "max_batch_size": 32,
+    "batch_window": 0.01,
+    # lines are split into batches of similar length; 0 samples each batch as a whole
+    "length_bucket_width": 20,
+    # lines of a stream sampled ahead of the line currently being emitted
+    "stream_lookahead": 4,
+}
+
+SAMPLING_CONFIG = {
+    # sample in chunks of timesteps and drop finished lines from the batch between chunks
+    "compact_finished_rows": False,
+    "chunk_tsteps": 64,
+    # timesteps sampled per step of an incremental stream; smaller paints sooner
+    "stream_chunk_tsteps": 16,
+}
+
+INFERENCE_CONFIG = {
+    # tensorflow thread pools of the in-process session, 0 lets tensorflow pick
+    "intra_op_parallelism_threads": int(os.getenv("INTRA_OP_THREADS", "0")),
+    "inter_op_parallelism_threads": int(os.getenv("INTER_OP_THREADS", "0")),
+    # threads running blocking generation calls, kept apart from the event loop's default executor
+    "executor_workers": int(os.getenv("INFERENCE_EXECUTOR_WORKERS", "4")),
+    # concurrent session.run calls allowed against the in-process session
+    "max_inflight_sessions": int(os.getenv("MAX_INFLIGHT_SESSIONS", "1")),
+}
+
+REPLICA_CONFIG = {
+    # worker processes each holding their own model session; 0 samples in the serving process
+    "num_replicas": int(os.getenv("NUM_REPLICAS", "0")),
+    # per-replica thread counts, 0 splits the cores evenly between replicas
+    "intra_op_parallelism_threads": int(os.getenv("REPLICA_INTRA_OP_THREADS", "0")),
+    "inter_op_parallelism_threads": int(os.getenv("REPLICA_INTER_OP_THREADS", "1")),
+}
+
+RESULT_CACHE_CONFIG = {
+    # bytes of sampled strokes of seeded generations kept in memory, least recently used evicted first
+    "max_bytes": int(os.getenv("RESULT_CACHE_MAX_BYTES", str(128 * 2**20))),
+    # optional directory persisting cached strokes across restarts and replicas
+    "directory": os.getenv("RESULT_CACHE_DIR") or None,
+    # threads reading the directory, kept apart from the inference executor that waits on them
+    "io_workers": int(os.getenv("RESULT_CACHE_IO_WORKERS", "2")),
+}
+
+GEOMETRY_CACHE_CONFIG = {
+    # bytes of denoised and aligned line coordinates kept in memory, keyed by the sampled strokes
+    "max_bytes": int(os.getenv("GEOMETRY_CACHE_MAX_BYTES", str(64 * 2**20))),
+}
+
+DOCUMENT_CACHE_CONFIG = {
+    # bytes of sampled strokes kept per generated document so it can be restyled by handle
+    "max_bytes": int(os.getenv("DOCUMENT_CACHE_MAX_BYTES", str(128 * 2**20))),
+}
+
+RASTER_CONFIG = {
+    # bytes of per-line coverage tiles kept in memory for composing png and webp output
+    "tile_cache_max_bytes": int(os.getenv("RASTER_TILE_CACHE_MAX_BYTES", str(64 * 2**20))),
+    "webp_quality": int(os.getenv("WEBP_QUALITY", "90")),
+}
+
+PAGE_CONFIG = {
+    # default layout of paginated pdf documents; sizes are the names in pdf_utils.PAGE_SIZES
+    "page_size": os.getenv("PDF_PAGE_SIZE", "a4"),
+    "margin": float(os.getenv("PDF_PAGE_MARGIN", "36")),
+    # 0 fits as many lines as the page holds at the width between the margins
+    "lines_per_page": int(os.getenv("PDF_LINES_PER_PAGE", "0")),
+    # pages whose lines are sampled ahead of the page being written
+    "lookahead_pages": 1,
+}
+
+JOB_CONFIG = {
+    # bulk jobs write one file per document to a directory of this, or zip them next to it
+    "output_dir": os.getenv("JOB_OUTPUT_DIR") or os.path.join(OUTPUT_DIR, "jobs"),
+    # lines queued on the scheduler ahead of the document being written; keeps batches full
+    # without making interactive requests wait behind a whole job
+    "max_pending_lines": int(os.getenv("JOB_MAX_PENDING_LINES", "256")),
+    "max_concurrent_jobs": int(os.getenv("JOB_MAX_CONCURRENT", "1")),
+    # finished jobs are forgotten, and their output deleted, once they are older than this
+    # or once more than max_finished_jobs newer jobs have finished
+    "retention_seconds": float(os.getenv("JOB_RETENTION_SECONDS", "86400")),
+    "max_finished_jobs": int(os.getenv("JOB_MAX_FINISHED", "100")),
 }
 
 LOGGING_LEVEL = logging.INFO
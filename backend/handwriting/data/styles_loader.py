@@ -1,16 +1,103 @@
+import hashlib
+import os
+import re
+import threading
 import numpy as np
 import handwriting.utils.drawing_utils as drawing
-from handwriting.config import STYLES_DIR
+from handwriting.config import STYLES_DIR, EXTRA_STYLES_DIRS
+
+STYLE_STROKES_PATTERN = re.compile(r'^style-(.+)-strokes\.npy$')
 
 class StylesLoader:
-    def __init__(self, style_directory=STYLES_DIR):
+    """In-memory bank of priming styles, loaded once and reloadable on demand.
+
+    Strokes are kept as read-only contiguous float32 arrays and the style characters are
+    encoded up front, so looking up a style only has to encode the new line.  Every style also
+    has a digest of its contents, so results derived from it can tell when it was replaced.
+    """
+
+    def __init__(self, style_directory=STYLES_DIR, extra_style_directories=EXTRA_STYLES_DIRS):
         self.style_directory = style_directory
+        self.extra_style_directories = list(extra_style_directories)
+        self._lock = threading.Lock()
+        self._styles = {}
+        self.reload()
+
+    @property
+    def styles(self):
+        return sorted(self._styles, key=lambda k: (isinstance(k, str), k if isinstance(k, int) else 0, str(k)))
+
+    def reload(self):
+        """Re-read every style file from the configured directories"""
+        styles = {}
+        for directory in [self.style_directory] + self.extra_style_directories:
+            styles.update(self._load_directory(directory))
+        with self._lock:
+            self._styles = styles
+
+    def add_style_directory(self, directory):
+        """Load user-supplied style files, overriding existing styles with the same index"""
+        styles = self._load_directory(directory)
+        with self._lock:
+            self.extra_style_directories.append(directory)
+            self._styles = {**self._styles, **styles}
+
+    def add_style(self, style_index, strokes, chars):
+        """Register a style from in-memory strokes and the text they were written from"""
+        with self._lock:
+            self._styles = {**self._styles, style_index: self._build_style(strokes, chars)}
+
+    def digest(self, style_index):
+        return self._get_style(style_index)[2]
+
+    def digests(self):
+        return {style_index: style[2] for style_index, style in self._styles.items()}
 
     def load_style(self, line, style_index):
+        strokes, encoded_chars, _ = self._get_style(style_index)
+        return strokes, np.concatenate([encoded_chars, drawing.encode_ascii(" " + line)])
+
+    def load_prime(self, style_index):
+        """Return the style strokes and its encoded characters followed by a space, without a terminator.
+
+        The state primed on these is shared by every line of the style.  It approximates priming on
+        the style followed by the line itself, whose last priming steps would see the line's first
+        characters after the space.  Without the terminator they see nothing there, rather than an
+        end of text that pushes the free run towards stopping.
+        """
+        strokes, encoded_chars, _ = self._get_style(style_index)
+        return strokes, np.concatenate([encoded_chars, drawing.encode_ascii(" ")[:-1]])
+
+    def _get_style(self, style_index):
         try:
-            strokes = np.load(f'{self.style_directory}/style-{style_index}-strokes.npy')
-            chars = np.load(f'{self.style_directory}/style-{style_index}-chars.npy').tobytes().decode('utf-8')
-            return strokes, drawing.encode_ascii(chars + " " + line)
-        except Exception as e:
-            raise ValueError(f"Error loading style {style_index}: {e}")
-        
\ No newline at end of file
+            return self._styles[style_index]
+        except KeyError:
+            raise ValueError(f"Error loading style {style_index}: style not found")
+
+    def _load_directory(self, directory):
+        styles = {}
+        for filename in sorted(os.listdir(directory)):
+            match = STYLE_STROKES_PATTERN.match(filename)
+            if not match:
+                continue
+
+            name = match.group(1)
+            try:
+                strokes = np.load(os.path.join(directory, filename))
+                chars = np.load(os.path.join(directory, f'style-{name}-chars.npy')).tobytes().decode('utf-8')
+            except Exception as e:
+                raise ValueError(f"Error loading style {name} from {directory}: {e}")
+
+            style_index = int(name) if name.isdigit() else name
+            styles[style_index] = self._build_style(strokes, chars)
+        return styles
+
+    @staticmethod
+    def _build_style(strokes, chars):
+        strokes = np.ascontiguousarray(strokes, dtype=np.float32)
+        strokes.setflags(write=False)
+        # drop the terminating null so the encoded line can be appended directly
+        encoded_chars = drawing.encode_ascii(chars)[:-1]
+        encoded_chars.setflags(write=False)
+        digest = hashlib.sha1(strokes.tobytes() + chars.encode('utf-8')).hexdigest()
+        return strokes, encoded_chars, digest
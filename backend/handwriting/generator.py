@@ -7,31 +7,44 @@ import cairosvg
 import functools
 import traceback
 from dataclasses import dataclass
-from typing import List, Dict, Optional, Any, Generator, Tuple, Union
-from collections import OrderedDict
-import time
+from typing import List, Dict, Optional, Any, AsyncGenerator, Generator, Tuple, Union
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import hashlib
+import uuid
 
 from handwriting.config import (
-    MODEL_CONFIG, 
     OUTPUT_CONFIG, 
-    CHECKPOINT_DIR, 
+    INFERENCE_CONFIG,
+    REPLICA_CONFIG,
+    RESULT_CACHE_CONFIG,
+    SCHEDULER_CONFIG,
+    GEOMETRY_CACHE_CONFIG,
+    DOCUMENT_CACHE_CONFIG,
+    PAGE_CONFIG,
+    RASTER_CONFIG,
     LOG_DIR, 
-    PREDICTIONS_DIR, 
     setup_logging
 )
+import handwriting.utils.color_utils as color_utils
 import handwriting.utils.drawing_utils as drawing
-from handwriting.data.styles_loader import StylesLoader
-from handwriting.models.rnn import rnn
+import handwriting.utils.stroke_frames as stroke_frames
+import handwriting.utils.pdf_utils as pdf_utils
+import handwriting.utils.raster_utils as raster_utils
+import handwriting.postprocessing as postprocessing
+from handwriting.cache import LRUCache, ResultCache, model_version
+from handwriting.replicas import ReplicaPool
+from handwriting.sampler import StrokeSampler
+from handwriting.scheduler import BatchScheduler
 
 setup_logging(log_file=f"{LOG_DIR}/handwriting_generator.log")
 
 STROKE_SCALE = 1.5
 MAX_LINE_LENGTH = 75
-MAX_TSTEPS_MULTIPLIER = 40
 STROKE_EOS_THRESHOLD = 0.95
 DEFAULT_STROKE_COLOR = 'black'
-MAX_CACHE_SIZE = 32
-CACHE_CLEANUP_INTERVAL = 300
+# trailing points of an incremental stream that can still move when more points are sampled
+INCREMENTAL_HOLDBACK = drawing.SAVGOL_WINDOW // 2
 
 @dataclass
 class StrokeConfig:
@@ -40,54 +53,60 @@ class StrokeConfig:
     view_width = OUTPUT_CONFIG["view_width"]
     default_stroke_width = OUTPUT_CONFIG["default_stroke_width"]
 
+@dataclass
+class Document:
+    """Sampled strokes of a generation, kept so it can be restyled without resampling"""
+    lines: List[str]
+    strokes: List[np.ndarray]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(line_strokes.nbytes for line_strokes in self.strokes)
+
+def _resolve(future: Future, result: Any = None, exception: Optional[BaseException] = None) -> None:
+    """Complete a future created with Future() unless it was cancelled"""
+    if not future.set_running_or_notify_cancel():
+        return
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+
+def _copy_outcome(target: Future, source: Future) -> None:
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        _resolve(target, exception=source.exception())
+    else:
+        _resolve(target, source.result())
+
 class Hand:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
-        self.nn = rnn(
-            log_dir=LOG_DIR,
-            checkpoint_dir=CHECKPOINT_DIR,
-            prediction_dir=PREDICTIONS_DIR,
-            **MODEL_CONFIG
+        if REPLICA_CONFIG["num_replicas"] > 0:
+            self.sampler = ReplicaPool(REPLICA_CONFIG["num_replicas"])
+            max_concurrent_batches = REPLICA_CONFIG["num_replicas"]
+        else:
+            self.sampler = StrokeSampler()
+            max_concurrent_batches = INFERENCE_CONFIG["max_inflight_sessions"]
+        self.scheduler = BatchScheduler(self.sampler.sample, max_concurrent_batches=max_concurrent_batches)
+        # generation gets its own bounded pool so it does not compete with PDF rendering
+        # and other work on the event loop's default executor
+        self._executor = ThreadPoolExecutor(
+            max_workers=INFERENCE_CONFIG["executor_workers"],
+            thread_name_prefix="inference"
         )
-        self.nn.restore()
-        self.styles_loader = StylesLoader()
+        self.result_cache = ResultCache(model_version())
+        # reads of the on-disk result cache get their own threads: inference threads block on
+        # the futures they resolve, so queueing the reads behind them could deadlock
+        self._cache_executor = ThreadPoolExecutor(
+            max_workers=RESULT_CACHE_CONFIG["io_workers"],
+            thread_name_prefix="result-cache"
+        )
+        self.geometry_cache = LRUCache(GEOMETRY_CACHE_CONFIG["max_bytes"])
+        self.tile_cache = LRUCache(RASTER_CONFIG["tile_cache_max_bytes"], sizeof=lambda mask: mask.width * mask.height)
+        self.documents = LRUCache(DOCUMENT_CACHE_CONFIG["max_bytes"])
         self.stroke_config = StrokeConfig()
-        self._stroke_transforms = OrderedDict()
-        self._last_cleanup = time.time()
-
-    def _cleanup_cache(self, force: bool = False) -> None:
-        """Cleanup old cache entries"""
-        current_time = time.time()
-        if not force and current_time - self._last_cleanup < CACHE_CLEANUP_INTERVAL:
-            return
-
-        while len(self._stroke_transforms) > MAX_CACHE_SIZE:
-            self._stroke_transforms.popitem(last=False)
-            
-        cutoff_time = current_time - CACHE_CLEANUP_INTERVAL
-        old_keys = [k for k, (t, _) in self._stroke_transforms.items() if t < cutoff_time]
-        for k in old_keys:
-            del self._stroke_transforms[k]
-            
-        self._last_cleanup = current_time
-
-    def _transform_strokes(self, strokes_key: str) -> np.ndarray:
-        """Transform strokes with time-based caching"""
-        current_time = time.time()
-        
-        if strokes_key in self._stroke_transforms:
-            _, result = self._stroke_transforms[strokes_key]
-            self._stroke_transforms.move_to_end(strokes_key)
-            return result
-
-        strokes = np.frombuffer(strokes_key, dtype=np.float32).reshape(-1, 3)
-        result = drawing.denoise(strokes)
-        result = drawing.align(result[:, :2])
-        
-        self._stroke_transforms[strokes_key] = (current_time, result)
-        self._cleanup_cache()
-        
-        return result
 
     async def write(self, 
                    lines: List[str], 
@@ -96,28 +115,289 @@ class Hand:
                    stroke_colors: Optional[List[str]] = None, 
                    stroke_widths: Optional[List[float]] = None, 
                    as_base64: bool = False, 
-                   as_pdf: bool = False) -> Union[str, bytes]:
-        """Async wrapper for write using run_in_executor"""
+                   as_pdf: bool = False,
+                   seed: Optional[int] = None,
+                   image_format: Optional[str] = None,
+                   image_scale: float = 1.0) -> Union[str, bytes]:
+        """Async wrapper for write running on the dedicated inference executor"""
         loop = asyncio._get_running_loop()
         result = await loop.run_in_executor(
-            None, functools.partial(
-                self._write_sync, lines, biases, styles, stroke_colors, stroke_widths, as_base64, as_pdf
+            self._executor, functools.partial(
+                self._write_sync, lines, biases, styles, stroke_colors, stroke_widths, as_base64, as_pdf, seed,
+                image_format, image_scale
             )
         )
         await asyncio.sleep(0)
         return result
-                
-    def _write_sync(self, lines, biases=None, styles=None, stroke_colors=None, stroke_widths=None, as_base64=False, as_pdf=False):
-        self.logger.debug(f"Received lines: {lines}, biases: {biases}, styles: {styles}")
+
+    def write_chunks(self,
+                     lines: List[str],
+                     biases: Optional[List[float]] = None,
+                     styles: Optional[List[int]] = None,
+                     stroke_colors: Optional[List[str]] = None,
+                     stroke_widths: Optional[List[float]] = None,
+                     as_pdf: bool = False,
+                     seed: Optional[int] = None,
+                     image_format: Optional[str] = None,
+                     image_scale: float = 1.0) -> Tuple[AsyncGenerator[bytes, None], str]:
+        """Start sampling a document, returning an async iterator over its output and its handle.
+
+        SVG output is yielded one line at a time as the lines are sampled, PDF output one page
+        at a time.  An image_format of raster_utils.IMAGE_FORMATS takes precedence over as_pdf;
+        its line tiles are drawn as the lines are sampled and the encoded image is yielded whole.
+        The handle accepts restyle_chunks once every line has been sampled.
+        """
+        self._validate_input(lines, set(drawing.alphabet))
+        self._validate_colors(stroke_colors)
+        biases = biases if biases is not None else [0.5] * len(lines)
+        styles = styles if styles is not None else [None] * len(lines)
+
+        futures = self._submit_lines(lines, biases, styles, seed)
+        handle = uuid.uuid4().hex
+        return self._stream_document(
+            handle, lines, futures, stroke_colors, stroke_widths, as_pdf, image_format, image_scale
+        ), handle
+
+    def restyle_chunks(self,
+                       handle: str,
+                       stroke_colors: Optional[List[str]] = None,
+                       stroke_widths: Optional[List[float]] = None,
+                       as_pdf: bool = False,
+                       image_format: Optional[str] = None,
+                       image_scale: float = 1.0) -> AsyncGenerator[bytes, None]:
+        """Re-render a previous generation with new presentation parameters, without resampling.
+
+        Returns an async iterator over the output, like write_chunks.
+        """
+        self._validate_colors(stroke_colors)
+        document = self._restyled_document(handle, stroke_colors, stroke_widths)
+        futures = []
+        for strokes in document.strokes:
+            future = Future()
+            future.set_result(strokes)
+            futures.append(future)
+        return self._stream_document(
+            handle, document.lines, futures, stroke_colors, stroke_widths, as_pdf, image_format, image_scale
+        )
+
+    async def _stream_document(self, handle, lines, futures, stroke_colors=None, stroke_widths=None, as_pdf=False,
+                               image_format=None, image_scale=1.0) -> AsyncGenerator[bytes, None]:
+        stroke_colors = stroke_colors or [DEFAULT_STROKE_COLOR] * len(lines)
+        stroke_widths = stroke_widths or [self.stroke_config.default_stroke_width] * len(lines)
+        view_height = self.stroke_config.line_height * (len(lines) + 1)
+
+        loop = asyncio._get_running_loop()
+        buffer = io.BytesIO()
+        writer = None
+        tiles = [] if image_format else None
+        try:
+            if image_format:
+                self.logger.info(f"Drawing {image_format} output...")
+            elif as_pdf:
+                writer = pdf_utils.PDFWriter(buffer, precision=OUTPUT_CONFIG["path_precision"])
+                writer.begin_page(self.stroke_config.view_width, view_height)
+                yield self._drain(buffer)
+            else:
+                head, tail = self._svg_shell(view_height)
+                yield head.encode('utf-8')
+
+            strokes = []
+            while len(strokes) < len(futures):
+                strokes.append(await asyncio.wrap_future(futures[len(strokes)]))
+                # lines already sampled behind it are laid out in the same pass
+                first = len(strokes) - 1
+                while len(strokes) < len(futures) and futures[len(strokes)].done():
+                    strokes.append(futures[len(strokes)].result())
+                line_indices = range(first, len(strokes))
+                fragment = await loop.run_in_executor(
+                    self._executor, self._draw_lines, [strokes[i] for i in line_indices], line_indices, lines,
+                    view_height, stroke_colors, stroke_widths, writer, tiles, image_scale
+                )
+                if fragment:
+                    yield fragment
+            self.documents.put(handle, Document(lines=list(lines), strokes=strokes))
+
+            if image_format:
+                yield await loop.run_in_executor(
+                    self._executor, self._encode_image, tiles, view_height, image_format, image_scale
+                )
+            elif as_pdf:
+                writer.save()
+                yield self._drain(buffer)
+            else:
+                yield tail.encode('utf-8')
+
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _draw_lines(self, samples, line_indices, lines, view_height, stroke_colors, stroke_widths, writer=None,
+                    tiles=None, image_scale=1.0) -> bytes:
+        """Lay out sampled lines in one pass and draw them with the PDF writer or onto raster tiles
+        if given, otherwise return their SVG paths"""
+        drawn = [row for row, line_idx in enumerate(line_indices) if lines[line_idx] and len(samples[row])]
+        positions = [line_indices[row] for row in drawn]
+        line_coords = self._process_lines([samples[row] for row in drawn], positions)
+
+        fragments = []
+        for line_idx, coords in zip(positions, line_coords):
+            color, width = stroke_colors[line_idx], stroke_widths[line_idx]
+            if tiles is not None:
+                tiles.append(self._line_tile(coords, view_height, color, width, image_scale))
+            elif writer is not None:
+                writer.draw_strokes(coords, color, width, bounds=self._view_bounds(view_height))
+            else:
+                fragments.append(self._svg_path(coords, view_height, color, width))
+        return ''.join(fragments).encode('utf-8')
+
+    def _line_tile(self, coords, view_height, color, width, scale):
+        """Raster tile of a laid-out line, reusing the cached tile of an identically placed line"""
+        origin, points = raster_utils.tile_points(coords, width, scale, bounds=self._view_bounds(view_height))
+        # the end of stroke column decides where the pen lifts, so it is part of the key
+        key = self._geometry_key(points) + self._geometry_key(coords[:, 2]) + f"{float(width)}:{float(scale)}".encode()
+        mask = self.tile_cache.get(key)
+        if mask is None:
+            mask = raster_utils.draw_tile(points, coords[:, 2], width, scale)
+            self.tile_cache.put(key, mask)
+        return origin, mask, color
+
+    def _encode_image(self, tiles, view_height, image_format, scale) -> bytes:
+        size = (int(round(self.stroke_config.view_width * scale)), int(round(view_height * scale)))
+        image = raster_utils.compose(size, tiles)
+        return raster_utils.encode(image, image_format, quality=RASTER_CONFIG["webp_quality"])
+
+    def _draw_image(self, strokes, lines, stroke_colors=None, stroke_widths=None, image_format="png", image_scale=1.0):
+        self.logger.info(f"Drawing {image_format} output...")
+
+        stroke_colors = stroke_colors or [DEFAULT_STROKE_COLOR] * len(lines)
+        stroke_widths = stroke_widths or [self.stroke_config.default_stroke_width] * len(lines)
+        view_height = self.stroke_config.line_height * (len(strokes) + 1)
+        tiles = [
+            self._line_tile(coords, view_height, stroke_colors[i], stroke_widths[i], image_scale)
+            for i, coords in self._laid_out_lines(strokes, lines)
+        ]
+        return self._encode_image(tiles, view_height, image_format, image_scale)
+
+    def _restyled_document(self, handle, stroke_colors, stroke_widths) -> Document:
+        document = self.documents.get(handle)
+        if document is None:
+            raise KeyError(f"Unknown or expired document handle {handle}")
+        for name, values in (("stroke_colors", stroke_colors), ("stroke_widths", stroke_widths)):
+            if values is not None and len(values) != len(document.lines):
+                raise ValueError(f"{name} must have one entry per line ({len(document.lines)})")
+        return document
+
+    def write_pages(self,
+                    lines: List[str],
+                    biases: Optional[List[float]] = None,
+                    styles: Optional[List[int]] = None,
+                    stroke_colors: Optional[List[str]] = None,
+                    stroke_widths: Optional[List[float]] = None,
+                    seed: Optional[int] = None,
+                    page_size: str = PAGE_CONFIG["page_size"],
+                    margin: float = PAGE_CONFIG["margin"],
+                    lines_per_page: int = PAGE_CONFIG["lines_per_page"]) -> AsyncGenerator[bytes, None]:
+        """Start sampling a paginated PDF, returning an async iterator that yields it a page at a time.
+
+        Input is validated and the first pages are queued before returning, so errors are raised
+        here rather than once the response has started.  Only the current page and the pages
+        sampled ahead of it are held in memory, so the document is not stored for restyling.
+        """
+        if page_size not in pdf_utils.PAGE_SIZES:
+            raise ValueError(f"Unknown page size {page_size}, expected one of {sorted(pdf_utils.PAGE_SIZES)}")
+        self._validate_input(lines, set(drawing.alphabet))
+        self._validate_colors(stroke_colors)
+
+        num_samples = len(lines)
+        biases = biases if biases is not None else [0.5] * num_samples
+        styles = styles if styles is not None else [None] * num_samples
+        stroke_colors = stroke_colors or [DEFAULT_STROKE_COLOR] * num_samples
+        stroke_widths = stroke_widths or [self.stroke_config.default_stroke_width] * num_samples
+
+        page_points = pdf_utils.PAGE_SIZES[page_size]
+        lines_per_page = lines_per_page or pdf_utils.lines_per_page(
+            page_points, margin, self.stroke_config.view_width, self.stroke_config.line_height
+        )
+        pages = [range(start, min(start + lines_per_page, num_samples)) for start in range(0, num_samples, lines_per_page)]
+        self.logger.info(f"Writing {num_samples} lines to {len(pages)} {page_size} pages...")
+
+        def submit_page(page):
+            return [self._submit_line(lines[i], styles[i], biases[i], seed) if lines[i] else None for i in page]
+
+        # futures of the pages sampled ahead of the one being written
+        pending = deque(submit_page(page) for page in pages[:PAGE_CONFIG["lookahead_pages"] + 1])
+        return self._stream_pages(
+            pages, pending, submit_page, stroke_colors, stroke_widths, lines_per_page, page_points, margin
+        )
+
+    async def _stream_pages(self, pages, pending, submit_page, stroke_colors, stroke_widths, lines_per_page,
+                            page_points, margin) -> AsyncGenerator[bytes, None]:
+        buffer = io.BytesIO()
+        writer = pdf_utils.PDFWriter(buffer, precision=OUTPUT_CONFIG["path_precision"])
+        loop = asyncio._get_running_loop()
+        submitted = len(pending)
+        futures = []
+        try:
+            for page in pages:
+                futures = pending.popleft()
+                while submitted < len(pages) and len(pending) < PAGE_CONFIG["lookahead_pages"]:
+                    pending.append(submit_page(pages[submitted]))
+                    submitted += 1
+
+                samples = [await asyncio.wrap_future(future) if future is not None else None for future in futures]
+                await loop.run_in_executor(
+                    self._executor, self._write_page, writer, page, samples, stroke_colors, stroke_widths,
+                    lines_per_page, page_points, margin
+                )
+                yield self._drain(buffer)
+
+            writer.save()
+            yield self._drain(buffer)
+
+        finally:
+            # includes the page being awaited when the client disconnects
+            for page_futures in [futures, *pending]:
+                for future in page_futures:
+                    if future is not None:
+                        future.cancel()
+
+    def _write_page(self, writer, page, samples, stroke_colors, stroke_widths, lines_per_page, page_points, margin):
+        """Lay out one page of sampled lines and write it with the PDF writer"""
+        view_height = self.stroke_config.line_height * (lines_per_page + 1)
+        rows = [row for row, sample in enumerate(samples) if sample is not None and len(sample)]
+        line_coords = self._process_lines([samples[row] for row in rows], rows)
+
+        writer.begin_page(self.stroke_config.view_width, view_height, page_size=page_points, margin=margin)
+        for row, coords in zip(rows, line_coords):
+            line_idx = page[row]
+            writer.draw_strokes(coords, stroke_colors[line_idx], stroke_widths[line_idx], bounds=self._view_bounds(view_height))
+        writer.end_page()
+
+    @staticmethod
+    def _drain(buffer: io.BytesIO) -> bytes:
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    def _write_sync(self, lines, biases=None, styles=None, stroke_colors=None, stroke_widths=None, as_base64=False, as_pdf=False, seed=None,
+                    image_format=None, image_scale=1.0):
+        self.logger.debug(f"Received lines: {lines}, biases: {biases}, styles: {styles}, seed: {seed}")
         valid_char_set = set(drawing.alphabet)
         self._validate_input(lines, valid_char_set)
 
-        strokes = self._sample(lines, biases=biases, styles=styles)
-        svg_output = self._draw(strokes, lines, stroke_colors=stroke_colors, stroke_widths=stroke_widths)
+        strokes = self._sample(lines, biases=biases, styles=styles, seed=seed)
+        return self._render(strokes, lines, stroke_colors, stroke_widths, as_base64, as_pdf, image_format, image_scale)
+
+    def _render(self, strokes, lines, stroke_colors=None, stroke_widths=None, as_base64=False, as_pdf=False,
+                image_format=None, image_scale=1.0):
+        if image_format:
+            return self._draw_image(strokes, lines, stroke_colors, stroke_widths, image_format, image_scale)
 
         if as_pdf:
-            pdf_output = self._generate_pdf_sync(svg_output)
-            return pdf_output
+            return self._draw_pdf(strokes, lines, stroke_colors=stroke_colors, stroke_widths=stroke_widths)
+
+        svg_output = self._draw(strokes, lines, stroke_colors=stroke_colors, stroke_widths=stroke_widths)
 
         if as_base64:
             svg_base64 = self._encode_svg_to_base64(svg_output)
@@ -136,50 +416,85 @@ class Hand:
             if invalid_chars:
                 raise ValueError(f"Invalid characters in line {line_num}: {invalid_chars}")
 
-    def _sample(self, lines, biases=None, styles=None):
-        self.logger.info("Sampling strokes for handwriting generation...")
-        
-        num_samples = len(lines)
-        max_tsteps = MAX_TSTEPS_MULTIPLIER * max(len(line) for line in lines)
-        biases = biases if biases is not None else [0.5] * num_samples
-
-        x_prime = np.zeros([num_samples, 1200, 3])
-        x_prime_len = np.zeros([num_samples])
-        chars = np.zeros([num_samples, 120])
-        chars_len = np.zeros([num_samples])
-
-        if styles is not None:
-            for i, (line, style) in enumerate(zip(lines, styles)):
-                x_p, c_p = self.styles_loader.load_style(line, style)
-                x_prime[i, :len(x_p), :] = x_p
-                x_prime_len[i] = len(x_p)
-                chars[i, :len(c_p)] = np.array(c_p)
-                chars_len[i] = len(c_p)
-        else:
-            for i in range(num_samples):
-                encoded = drawing.encode_ascii(lines[i])
-                chars[i, :len(encoded)] = encoded
-                chars_len[i] = len(encoded)
+    @staticmethod
+    def _validate_colors(stroke_colors: Optional[List[str]]) -> None:
+        """Reject colors the writers cannot draw before any output has been sent"""
+        for line_num, color in enumerate(stroke_colors or []):
+            try:
+                color_utils.parse_color(color)
+            except ValueError:
+                raise ValueError(f"Unsupported stroke color for line {line_num}: {color!r}")
 
+    def _sample(self, lines, biases=None, styles=None, seed=None):
+        self.logger.info("Sampling strokes for handwriting generation...")
+        biases = biases if biases is not None else [0.5] * len(lines)
+        styles = styles if styles is not None else [None] * len(lines)
+
+        return [future.result() for future in self._submit_lines(lines, biases, styles, seed)]
+
+    def _submit_lines(self, lines, biases, styles, seed=None) -> List[Future]:
+        # with a seed, repeated lines (e.g. a chorus) come out identical, so each is sampled once
+        futures = {}
+        line_futures = []
+        for line, style, bias in zip(lines, styles, biases):
+            key = (line, style, float(bias)) if seed is not None else len(line_futures)
+            if key not in futures:
+                futures[key] = self._submit_line(line, style, bias, seed)
+            line_futures.append(futures[key])
+        return line_futures
+
+    def _submit_line(self, line: str, style: Optional[int], bias: float, seed: Optional[int] = None) -> Future:
+        """Queue a line for sampling, serving seeded lines from the result cache when possible.
+
+        Only the in-memory cache is checked on the calling thread, which may be the event loop;
+        the on-disk cache is read on the cache executor before falling back to sampling.
+        """
+        if seed is None:
+            return self.scheduler.submit(line, style, bias)
+
+        style_digest = None if style is None else self.sampler.style_digest(style)
+        key = self.result_cache.key(line, style, style_digest, bias, seed)
+        strokes = self.result_cache.get(key, load=False)
+        if strokes is not None:
+            future = Future()
+            future.set_result(strokes)
+            return future
+
+        if not self.result_cache.directory:
+            return self._sample_and_cache(key, line, style, bias, seed)
+
+        future = Future()
+        self._cache_executor.submit(self._load_or_sample, future, key, line, style, bias, seed)
+        return future
+
+    def _load_or_sample(self, future: Future, key: str, line: str, style: Optional[int], bias: float, seed: int) -> None:
         try:
-            samples = self.nn.session.run(
-                [self.nn.sampled_sequence],
-                feed_dict={
-                    self.nn.prime: styles is not None,
-                    self.nn.x_prime: x_prime,
-                    self.nn.x_prime_len: x_prime_len,
-                    self.nn.num_samples: num_samples,
-                    self.nn.sample_tsteps: max_tsteps,
-                    self.nn.c: chars,
-                    self.nn.c_len: chars_len,
-                    self.nn.bias: biases
-                }
-            )[0]
+            strokes = self.result_cache.get(key)
         except Exception as e:
-            self.logger.error(f"Error during sampling: {e}")
-            raise
+            _resolve(future, exception=e)
+            return
+        if strokes is not None:
+            _resolve(future, strokes)
+            return
+        if future.cancelled():
+            return
+
+        sampled = self._sample_and_cache(key, line, style, bias, seed)
+        future.add_done_callback(lambda f: sampled.cancel() if f.cancelled() else None)
+        sampled.add_done_callback(functools.partial(_copy_outcome, future))
 
-        return [sample[~np.all(sample == 0.0, axis=1)] for sample in samples]
+    def _sample_and_cache(self, key: str, line: str, style: Optional[int], bias: float, seed: int) -> Future:
+        future = self.scheduler.submit(line, style, bias, seed)
+        future.add_done_callback(functools.partial(self._cache_result, key))
+        return future
+
+    def _cache_result(self, key: str, future: Future) -> None:
+        if not future.cancelled() and future.exception() is None:
+            self.result_cache.put(key, future.result())
+
+    def reload_styles(self) -> None:
+        """Reload the style bank used for priming"""
+        self.sampler.reload_styles()
 
     def _draw(self, strokes, lines, stroke_colors=None, stroke_widths=None):
         self.logger.info("Drawing SVG output...")
@@ -187,65 +502,59 @@ class Hand:
         stroke_colors = stroke_colors or [DEFAULT_STROKE_COLOR] * len(lines)
         stroke_widths = stroke_widths or [self.stroke_config.default_stroke_width] * len(lines)
 
-        line_height = self.stroke_config.line_height
+        view_height = self.stroke_config.line_height * (len(strokes) + 1)
+        head, tail = self._svg_shell(view_height)
+        paths = [
+            self._svg_path(coords, view_height, stroke_colors[i], stroke_widths[i])
+            for i, coords in self._laid_out_lines(strokes, lines)
+        ]
+        return head + ''.join(paths) + tail
+
+    def _svg_shell(self, view_height: float) -> Tuple[str, str]:
+        """Markup of an SVG document before and after its line paths"""
         view_width = self.stroke_config.view_width
-        view_height = line_height * (len(strokes) + 1)
-        
-        padding = self.stroke_config.padding
-        
+
         dwg = svgwrite.Drawing()
         dwg.viewbox(width=view_width, height=view_height)
-        
+
         clip_path = dwg.defs.add(dwg.clipPath(id='clip-path'))
         clip_path.add(dwg.rect((0, 0), (view_width, view_height)))
-        
+
         group = dwg.g(clip_path='url(#clip-path)')
         group.add(dwg.rect(insert=(0, 0), size=(view_width, view_height), fill='white'))
         dwg.add(group)
 
-        initial_coord = np.array([padding, -(3 * line_height / 4)])
-        for offsets, line, color, width in zip(strokes, lines, stroke_colors, stroke_widths):
-            if not line:
-                initial_coord[1] -= line_height
-                continue
+        markup = dwg.tostring()
+        split = markup.rindex('</g>')
+        return markup[:split], markup[split:]
 
-            offsets[:, :2] *= STROKE_SCALE
-            strokes = drawing.offsets_to_coords(offsets)
-            strokes = drawing.denoise(strokes)
-            strokes[:, :2] = drawing.align(strokes[:, :2])
+    def _svg_path(self, coords: np.ndarray, view_height: float, color: str, width: float) -> str:
+        path_data = self._path_data(coords, view_height)
+        return svgwrite.path.Path(path_data).stroke(color=color, width=width, linecap='round').fill("none").tostring()
 
-            strokes[:, 1] *= -1
-            
-            x_min, x_max = strokes[:, 0].min(), strokes[:, 0].max()
-            y_min, y_max = strokes[:, 1].min(), strokes[:, 1].max()
-            
-            available_width = view_width - 2 * padding
-            available_height = line_height - padding
-            
-            scale_x = available_width / (x_max - x_min) if x_max != x_min else 1
-            scale_y = available_height / (y_max - y_min) if y_max != y_min else 1
-            scale = min(scale_x, scale_y, 1.0)
-            
-            strokes[:, :2] *= scale
-            strokes[:, :2] -= np.array([x_min * scale, y_min * scale]) + initial_coord
-            
-            x_offset = (view_width - (strokes[:, 0].max() - strokes[:, 0].min())) / 2
-            strokes[:, 0] += x_offset - strokes[:, 0].min()
-
-            path_data = "M{},{} ".format(0, 0)
-            prev_eos = 1.0
-            for x, y, eos in zip(*strokes.T):
-                x = max(padding, min(x, view_width - padding))
-                y = max(padding, min(y, view_height - padding))
-                path_data += '{}{},{} '.format('M' if prev_eos == 1.0 else 'L', x, y)
-                prev_eos = eos
+    def _draw_pdf(self, strokes, lines, stroke_colors=None, stroke_widths=None):
+        """Write the document as PDF path operators straight from the laid-out coordinates"""
+        self.logger.info("Drawing PDF output...")
 
-            path = svgwrite.path.Path(path_data).stroke(color=color, width=width, linecap='round').fill("none")
-            group.add(path)
-
-            initial_coord[1] -= line_height
+        stroke_colors = stroke_colors or [DEFAULT_STROKE_COLOR] * len(lines)
+        stroke_widths = stroke_widths or [self.stroke_config.default_stroke_width] * len(lines)
+        view_height = self.stroke_config.line_height * (len(strokes) + 1)
+        bounds = self._view_bounds(view_height)
 
-        return dwg.tostring()
+        pdf_output = io.BytesIO()
+        writer = pdf_utils.PDFWriter(pdf_output, precision=OUTPUT_CONFIG["path_precision"])
+        writer.begin_page(self.stroke_config.view_width, view_height)
+        for i, coords in self._laid_out_lines(strokes, lines):
+            writer.draw_strokes(coords, stroke_colors[i], stroke_widths[i], bounds=bounds)
+        writer.save()
+
+        pdf_output.seek(0)
+        return pdf_output
+
+    def _laid_out_lines(self, strokes, lines) -> List[Tuple[int, np.ndarray]]:
+        """Line numbers and laid-out coordinates of every line that has strokes"""
+        rows = [i for i, (line, offsets) in enumerate(zip(lines, strokes)) if line and len(offsets)]
+        return list(zip(rows, self._process_lines([strokes[i] for i in rows], rows)))
     
     async def stream_write(
         self, 
@@ -253,8 +562,12 @@ class Hand:
         biases: Optional[List[float]] = None, 
         styles: Optional[List[str]] = None, 
         stroke_colors: Optional[List[str]] = None, 
-        stroke_widths: Optional[List[float]] = None
-    ) -> Generator[Dict[str, Any], None, None]:
+        stroke_widths: Optional[List[float]] = None,
+        seed: Optional[int] = None,
+        incremental: bool = False,
+        as_binary: bool = False
+    ) -> Generator[Union[Dict[str, Any], bytes], None, None]:
+        """Yield setup, path and error events as dicts, or as stroke_frames frames when as_binary"""
         self.logger.info("Starting handwriting stream...")
         
         num_samples = len(lines)
@@ -265,123 +578,179 @@ class Hand:
         line_height = self.stroke_config.line_height
         view_width = self.stroke_config.view_width
         view_height = line_height * (len(lines) + 1)
-        padding = self.stroke_config.padding
-        initial_coord = np.array([padding, -(3 * line_height / 4)])
 
-        setup_data = {
-            'type': 'setup',
-            'viewBox': f"0 0 {view_width} {view_height}",
-            'width': view_width,
-            'height': view_height
-        }
-        yield setup_data
+        if as_binary:
+            yield stroke_frames.setup_frame(view_width, view_height, num_samples)
+        else:
+            setup_data = {
+                'type': 'setup',
+                'viewBox': f"0 0 {view_width} {view_height}",
+                'width': view_width,
+                'height': view_height
+            }
+            yield setup_data
 
-        try:
-            for line_idx, (line, bias, color, width) in enumerate(zip(lines, biases, stroke_colors, stroke_widths)):
-                if not line:
-                    initial_coord[1] -= line_height
-                    continue
+        line_indices = [i for i, line in enumerate(lines) if line]
+        styles = styles if styles is not None else [None] * num_samples
+        # lines being sampled in the background while earlier lines are emitted
+        lookahead = 0 if incremental else SCHEDULER_CONFIG["stream_lookahead"]
+        pending = deque()
+        submitted = 0
 
-                x_prime = np.zeros([1, 1200, 3])
-                x_prime_len = np.zeros([1])
-                chars = np.zeros([1, 120])
-                chars_len = np.zeros([1])
-
-                if styles is not None:
-                    x_p, c_p = self.styles_loader.load_style(line, styles[line_idx])
-                    x_prime[0, :len(x_p), :] = x_p
-                    x_prime_len[0] = len(x_p)
-                    chars[0, :len(c_p)] = np.array(c_p)
-                    chars_len[0] = len(c_p)
-                else:
-                    encoded = drawing.encode_ascii(line)
-                    chars[0, :len(encoded)] = encoded
-                    chars_len[0] = len(encoded)
-
-                max_tsteps = MAX_TSTEPS_MULTIPLIER * len(line)
-
-                samples = await asyncio._get_running_loop().run_in_executor(
-                    None,
-                    functools.partial(
-                        self.nn.session.run,
-                        [self.nn.sampled_sequence],
-                        feed_dict={
-                            self.nn.prime: styles is not None,
-                            self.nn.x_prime: x_prime,
-                            self.nn.x_prime_len: x_prime_len,
-                            self.nn.num_samples: 1,
-                            self.nn.sample_tsteps: max_tsteps,
-                            self.nn.c: chars,
-                            self.nn.c_len: chars_len,
-                            self.nn.bias: [bias]
-                        }
+        try:
+            for line_idx in line_indices:
+                if incremental:
+                    paths = self._stream_line_incremental(
+                        line_idx, lines[line_idx], styles[line_idx], biases[line_idx], seed
                     )
-                )
-                samples = samples[0]
-
-                all_strokes = samples[0][~np.all(samples[0] == 0.0, axis=1)]
-                
-                if len(all_strokes) == 0:
-                    continue
-
-                offsets = all_strokes.copy()
-                offsets[:, :2] *= STROKE_SCALE
-                strokes = drawing.offsets_to_coords(offsets)
-                strokes = drawing.denoise(strokes)
-                strokes[:, :2] = drawing.align(strokes[:, :2])
-                strokes[:, 1] *= -1
+                else:
+                    while submitted < len(line_indices) and len(pending) <= lookahead:
+                        i = line_indices[submitted]
+                        pending.append(self._submit_line(lines[i], styles[i], biases[i], seed))
+                        submitted += 1
+                    paths = self._stream_line(line_idx, pending.popleft())
+
+                if as_binary:
+                    yield stroke_frames.line_frame(line_idx, stroke_colors[line_idx], stroke_widths[line_idx])
+
+                async for coords in paths:
+                    if as_binary:
+                        yield stroke_frames.points_frame(line_idx, coords, self._view_bounds(view_height))
+                        await asyncio.sleep(0)
+                        continue
 
-                x_min, x_max = strokes[:, 0].min(), strokes[:, 0].max()
-                y_min, y_max = strokes[:, 1].min(), strokes[:, 1].max()
-                
-                available_width = view_width - 2 * padding
-                available_height = line_height - padding
-                
-                scale_x = available_width / (x_max - x_min) if x_max != x_min else 1
-                scale_y = available_height / (y_max - y_min) if y_max != y_min else 1
-                scale = min(scale_x, scale_y, 1.0)
-                
-                strokes[:, :2] *= scale
-                strokes[:, :2] -= np.array([x_min * scale, y_min * scale]) + initial_coord
-                
-                x_offset = (view_width - (strokes[:, 0].max() - strokes[:, 0].min())) / 2
-                strokes[:, 0] += x_offset - strokes[:, 0].min()
-
-                eos_indices = np.where(all_strokes[:, 2] >= STROKE_EOS_THRESHOLD)[0]
-                current_path = "M{},{} ".format(0, 0)
-                prev_eos = 1.0
-
-                for stroke_idx, (x, y, eos) in enumerate(zip(*strokes.T)):
-                    x = max(padding, min(x, view_width - padding))
-                    y = max(padding, min(y, view_height - padding))
-                    
-                    current_path += '{}{},{} '.format('M' if prev_eos == 1.0 else 'L', x, y)
-                    prev_eos = eos
-                    
-                    should_yield = (eos >= STROKE_EOS_THRESHOLD or stroke_idx in eos_indices or stroke_idx == len(strokes) - 1)
-                    
-                    if should_yield and current_path.strip() != "M0,0":
-                        path_data = {
+                    # whole lines are sent one path per stroke, incremental segments as they come
+                    strokes = [coords] if incremental else self._split_strokes(coords)
+                    for stroke in strokes:
+                        yield {
                             'type': 'path',
-                            'data': current_path,
-                            'color': color,
-                            'width': width,
+                            'data': self._path_data(stroke, view_height),
+                            'color': stroke_colors[line_idx],
+                            'width': stroke_widths[line_idx],
                             'lineNumber': line_idx
                         }
-                        yield path_data
                         await asyncio.sleep(0)
-                        current_path = "M{},{} ".format(0, 0)
-                        prev_eos = 1.0
-
-                initial_coord[1] -= line_height
 
         except Exception as e:
             self.logger.error(f"Error during real-time generation: {e}")
             self.logger.error(traceback.format_exc())
-            yield {
-                'type': 'error',
-                'message': str(e)
-            }
+            if as_binary:
+                yield stroke_frames.error_frame(str(e))
+            else:
+                yield {
+                    'type': 'error',
+                    'message': str(e)
+                }
+        finally:
+            # lines sampled ahead for a stream that ended early are dropped if not yet started
+            for future in pending:
+                future.cancel()
+
+    async def _stream_line(self, line_idx, future) -> AsyncGenerator[np.ndarray, None]:
+        """Wait for a line's samples, then yield its laid-out coordinates"""
+        loop = asyncio._get_running_loop()
+        all_strokes = await asyncio.wrap_future(future)
+        if len(all_strokes) == 0:
+            return
+
+        strokes = (await loop.run_in_executor(
+            self._executor, self._process_lines, [all_strokes], [line_idx]
+        ))[0]
+        yield strokes
+
+    @staticmethod
+    def _split_strokes(coords: np.ndarray) -> List[np.ndarray]:
+        stroke_ends = np.where(coords[:, 2] >= STROKE_EOS_THRESHOLD)[0] + 1
+        return [stroke for stroke in np.split(coords, stroke_ends) if len(stroke)]
+
+    async def _stream_line_incremental(self, line_idx, line, style, bias, seed) -> AsyncGenerator[np.ndarray, None]:
+        """Yield segments of a line's coordinates as it is sampled, a few timesteps at a time.
+
+        Points are smoothed but not slant corrected, and the line is scaled by an estimate from its
+        length rather than fitted to the view, since both depend on the finished line; the last few
+        points are held back until smoothing settles them.
+        """
+        loop = asyncio._get_running_loop()
+        scale = postprocessing.provisional_scale(
+            len(line), STROKE_SCALE, self.stroke_config.view_width, self.stroke_config.line_height,
+            self.stroke_config.padding
+        )
+        stream_id = await loop.run_in_executor(self._executor, self.sampler.start_stream, line, bias, style, seed)
+        chunks = []
+        emitted = 0
+        finished = False
+        try:
+            while not finished:
+                offsets, finished = await loop.run_in_executor(self._executor, self.sampler.advance_stream, stream_id)
+                chunks.append(offsets)
+                if not sum(len(chunk) for chunk in chunks):
+                    continue
+
+                coords = postprocessing.smooth(np.concatenate(chunks), STROKE_SCALE)
+                coords = postprocessing.place_line(
+                    coords, line_idx, self.stroke_config.line_height, self.stroke_config.padding, scale
+                )
+                settled = len(coords) if finished else len(coords) - INCREMENTAL_HOLDBACK
+                if settled > emitted:
+                    # start from the last emitted point so consecutive segments join up
+                    yield coords[max(emitted - 1, 0):settled]
+                    emitted = settled
+        finally:
+            if not finished:
+                self._executor.submit(self.sampler.close_stream, stream_id)
+
+    def _process_lines(self, samples: List[np.ndarray], positions: List[int]) -> List[np.ndarray]:
+        """Turn sampled offsets into laid-out coordinates for many lines in one vectorized pass.
+
+        Denoised and aligned geometry is cached per line, so re-rendering the same samples
+        only has to redo the layout.
+        """
+        if not samples:
+            return []
+
+        keys = [self._geometry_key(sample) for sample in samples]
+        geometry = [self.geometry_cache.get(key) for key in keys]
+        missing = [i for i, line_geometry in enumerate(geometry) if line_geometry is None]
+        if missing:
+            missing_lengths = np.array([len(samples[i]) for i in missing])
+            coords = postprocessing.smooth_and_align(
+                np.concatenate([samples[i] for i in missing]), missing_lengths, STROKE_SCALE
+            )
+            for i, line_geometry in zip(missing, postprocessing.split_lines(coords, missing_lengths)):
+                # copied so the cache is charged for (and only keeps alive) this line's points
+                geometry[i] = line_geometry.copy()
+                geometry[i].setflags(write=False)
+                self.geometry_cache.put(keys[i], geometry[i])
+
+        lengths = np.array([len(sample) for sample in samples])
+        coords = postprocessing.layout_lines(
+            np.concatenate(geometry),
+            lengths,
+            positions,
+            self.stroke_config.view_width,
+            self.stroke_config.line_height,
+            self.stroke_config.padding
+        )
+        return postprocessing.split_lines(coords, lengths)
+
+    @staticmethod
+    def _geometry_key(sample: np.ndarray) -> bytes:
+        sample = np.ascontiguousarray(sample)
+        return hashlib.sha1(sample.tobytes()).digest() + str((sample.dtype.str, sample.shape)).encode()
+
+    def _view_bounds(self, view_height: float) -> Tuple[Tuple[float, float], Tuple[float, float]]:
+        """Corners of the padded view that drawn points are clamped to"""
+        padding = self.stroke_config.padding
+        return (padding, padding), (self.stroke_config.view_width - padding, view_height - padding)
+
+    def _path_data(self, strokes: np.ndarray, view_height: float) -> str:
+        """Serialize laid-out strokes to SVG path data clamped inside the padded view"""
+        return drawing.svg_path(
+            strokes,
+            bounds=self._view_bounds(view_height),
+            precision=OUTPUT_CONFIG["path_precision"],
+            relative=OUTPUT_CONFIG["relative_paths"]
+        )
 
     def _optimize_strokes(self, strokes: np.ndarray, tolerance: float = 0.01) -> np.ndarray:
         """Optimize stroke data by removing redundant points"""
@@ -413,60 +782,10 @@ class Hand:
         pdf_output = io.BytesIO()
         try:
             self.logger.info("Generating PDF output...")
-            cairosvg.svg2pdf(bytestring=svg_output.encode('utf-8'), write_to=pdf_output)
+            svg_bytes = svg_output.encode('utf-8') if isinstance(svg_output, str) else svg_output
+            cairosvg.svg2pdf(bytestring=svg_bytes, write_to=pdf_output)
             pdf_output.seek(0)
             return pdf_output
         except Exception as e:
             self.logger.error(f"Error generating PDF: {e}")
             raise
-
-    @functools.lru_cache(maxsize=32)
-    def _transform_strokes(self, strokes_key: str) -> np.ndarray:
-        """Cache transformed strokes to avoid repeated calculations"""
-        strokes = np.frombuffer(strokes_key, dtype=np.float32).reshape(-1, 3)
-        strokes = drawing.denoise(strokes)
-        strokes = drawing.align(strokes[:, :2])
-        return strokes
-
-    def _prepare_feed_dict(self, line: str, style: Optional[str], bias: float) -> Dict[Any, Any]:
-        """Prepare neural network feed dictionary"""
-        x_prime = np.zeros([1, 1200, 3])
-        x_prime_len = np.zeros([1])
-        chars = np.zeros([1, 120])
-        chars_len = np.zeros([1])
-
-        if style is not None:
-            x_p, c_p = self.styles_loader.load_style(line, style)
-            x_prime[0, :len(x_p)] = x_p
-            x_prime_len[0] = len(x_p)
-            chars[0, :len(c_p)] = np.array(c_p)
-            chars_len[0] = len(c_p)
-        else:
-            encoded = drawing.encode_ascii(line)
-            chars[0, :len(encoded)] = encoded
-            chars_len[0] = len(encoded)
-
-        return {
-            self.nn.prime: style is not None,
-            self.nn.x_prime: x_prime,
-            self.nn.x_prime_len: x_prime_len,
-            self.nn.num_samples: 1,
-            self.nn.sample_tsteps: MAX_TSTEPS_MULTIPLIER * len(line),
-            self.nn.c: chars,
-            self.nn.c_len: chars_len,
-            self.nn.bias: [bias]
-        }
-
-    async def _run_model(self, feed_dict: Dict[Any, Any]) -> np.ndarray:
-        """Run model asynchronously"""
-        return await asyncio.get_running_loop().run_in_executor(
-            None,
-            functools.partial(self.nn.session.run, [self.nn.sampled_sequence], feed_dict=feed_dict)
-        )
-
-    def __del__(self):
-        """Cleanup all cached data"""
-        self._cleanup_cache(force=True)
-        self._stroke_transforms.clear()
-        self._transform_strokes.cache_clear()
-
@@ -0,0 +1,260 @@
+import io
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+import zipfile
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import handwriting.utils.drawing_utils as drawing
+from handwriting.config import JOB_CONFIG
+
+# seconds between checks for finished lines while waiting on a document
+REFILL_INTERVAL = 0.05
+# formats that are already compressed are stored in archives as is
+COMPRESSED_EXTENSIONS = {"pdf", "png", "webp"}
+
+
+@dataclass
+class JobDocument:
+    """One document of a bulk job, rendered like a /generate request"""
+    name: str
+    lines: List[str]
+    styles: Optional[List[int]] = None
+    biases: Optional[List[float]] = None
+    stroke_colors: Optional[List[str]] = None
+    stroke_widths: Optional[List[float]] = None
+    as_pdf: bool = False
+    image_format: Optional[str] = None
+    image_scale: float = 1.0
+    seed: Optional[int] = None
+
+    @property
+    def filename(self) -> str:
+        return f"{self.name}.{self.image_format or ('pdf' if self.as_pdf else 'svg')}"
+
+
+@dataclass
+class Job:
+    id: str
+    documents: List[JobDocument]
+    directory: str
+    archive: bool = False
+    status: str = "queued"
+    lines_done: int = 0
+    documents_done: int = 0
+    errors: Dict[str, str] = field(default_factory=dict)
+    created: float = field(default_factory=time.time)
+    finished: Optional[float] = None
+    cancelled: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def archive_path(self) -> Optional[str]:
+        return f"{self.directory}.zip" if self.archive else None
+
+    def progress(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "documents": len(self.documents),
+            "documents_done": self.documents_done,
+            "lines": sum(len(document.lines) for document in self.documents),
+            "lines_done": self.lines_done,
+            "errors": dict(self.errors),
+            "archive": self.archive,
+            "created": self.created,
+            "finished": self.finished,
+        }
+
+
+class JobManager:
+    """Renders batches of documents in the background, writing each to a file of the job's directory.
+
+    Lines of upcoming documents are queued on the hand's scheduler until `max_pending_lines`
+    of them are waiting to be sampled, so batches stay full across document boundaries
+    while the wait of interactive requests queued behind a job stays bounded.
+    Up to `max_concurrent_jobs` jobs run at once, the rest wait in submission order.
+    Archived jobs are zipped once every document is written and their directory removed.
+    Finished jobs are kept, with their output, for `retention_seconds` and at most
+    `max_finished_jobs` of them at a time.
+    """
+
+    def __init__(
+        self,
+        hand,
+        output_dir: str = JOB_CONFIG["output_dir"],
+        max_pending_lines: int = JOB_CONFIG["max_pending_lines"],
+        max_concurrent_jobs: int = JOB_CONFIG["max_concurrent_jobs"],
+        retention_seconds: float = JOB_CONFIG["retention_seconds"],
+        max_finished_jobs: int = JOB_CONFIG["max_finished_jobs"],
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.hand = hand
+        self.output_dir = output_dir
+        self.max_pending_lines = max_pending_lines
+        self.retention_seconds = retention_seconds
+        self.max_finished_jobs = max_finished_jobs
+        self.jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_jobs, thread_name_prefix="job")
+
+    def submit(self, documents: List[JobDocument], archive: bool = False) -> Job:
+        names = [document.name for document in documents]
+        if not documents:
+            raise ValueError("A job needs at least one document")
+        if len(set(names)) != len(names):
+            raise ValueError("Document names must be unique within a job")
+        valid_char_set = set(drawing.alphabet)
+        for document in documents:
+            self.hand._validate_input(document.lines, valid_char_set)
+
+        self._prune()
+        job_id = uuid.uuid4().hex
+        job = Job(id=job_id, documents=documents, directory=os.path.join(self.output_dir, job_id), archive=archive)
+        with self._lock:
+            self.jobs[job_id] = job
+        self._executor.submit(self._run, job)
+        self.logger.info(f"Queued job {job_id} of {len(documents)} documents")
+        return job
+
+    def get(self, job_id: str) -> Job:
+        self._prune()
+        with self._lock:
+            return self.jobs[job_id]
+
+    def cancel(self, job_id: str) -> Job:
+        job = self.get(job_id)
+        job.cancelled.set()
+        if job.status == "queued":
+            job.status = "cancelled"
+            job.finished = time.time()
+        return job
+
+    def _run(self, job: Job) -> None:
+        if job.cancelled.is_set():
+            return
+        job.status = "running"
+        os.makedirs(job.directory, exist_ok=True)
+
+        # documents whose lines are queued, each with one future per line
+        pending = deque()
+        submitted = 0
+        submitted_lines = 0
+        try:
+            while (submitted < len(job.documents) or pending) and not job.cancelled.is_set():
+                # top the queue up whenever lines finish, not only between documents
+                while submitted < len(job.documents) and (
+                    not pending or submitted_lines - job.lines_done + len(job.documents[submitted].lines) <= self.max_pending_lines
+                ):
+                    document = job.documents[submitted]
+                    pending.append((document, self._submit(job, document)))
+                    submitted_lines += len(document.lines)
+                    submitted += 1
+
+                document, futures = pending[0]
+                if wait(futures, timeout=REFILL_INTERVAL).not_done:
+                    continue
+                pending.popleft()
+                self._write_document(job, document, futures)
+
+            if job.cancelled.is_set():
+                job.status = "cancelled"
+            else:
+                if job.archive:
+                    self._write_archive(job)
+                job.status = "completed"
+
+        except Exception as e:
+            self.logger.exception(f"Job {job.id} failed: {e}")
+            job.errors["job"] = str(e)
+            job.status = "failed"
+
+        finally:
+            for _, futures in pending:
+                for future in futures:
+                    future.cancel()
+            job.finished = time.time()
+            self.logger.info(f"Job {job.id} {job.status} after {job.finished - job.created:.1f} seconds")
+
+    def _submit(self, job: Job, document: JobDocument) -> List[Future]:
+        biases = document.biases if document.biases is not None else [0.5] * len(document.lines)
+        styles = document.styles if document.styles is not None else [None] * len(document.lines)
+        futures = self.hand._submit_lines(document.lines, biases, styles, document.seed)
+        # repeated lines of a seeded document share a future
+        for future, count in Counter(futures).items():
+            future.add_done_callback(lambda f, count=count: None if f.cancelled() else self._count_lines(job, count))
+        return futures
+
+    def _count_lines(self, job: Job, count: int) -> None:
+        with self._lock:
+            job.lines_done += count
+
+    def _prune(self) -> None:
+        """Forget expired finished jobs and the oldest beyond max_finished_jobs, deleting their output"""
+        now = time.time()
+        with self._lock:
+            finished = sorted(
+                (job for job in self.jobs.values() if job.finished is not None), key=lambda job: job.finished, reverse=True
+            )
+            expired = [
+                job for rank, job in enumerate(finished)
+                if rank >= self.max_finished_jobs or now - job.finished > self.retention_seconds
+            ]
+            for job in expired:
+                del self.jobs[job.id]
+
+        if expired:
+            # pruning runs on request handlers, so the files are deleted in the background
+            threading.Thread(target=self._remove_output, args=(expired,), daemon=True).start()
+
+    def _remove_output(self, expired: List[Job]) -> None:
+        for job in expired:
+            shutil.rmtree(job.directory, ignore_errors=True)
+            if job.archive_path is not None and os.path.exists(job.archive_path):
+                os.remove(job.archive_path)
+            self.logger.info(f"Removed job {job.id} and its output")
+
+    def _write_document(self, job: Job, document: JobDocument, futures: List[Future]) -> None:
+        try:
+            strokes = [future.result() for future in futures]
+            output = self.hand._render(
+                strokes, document.lines, document.stroke_colors, document.stroke_widths,
+                as_pdf=document.as_pdf, image_format=document.image_format, image_scale=document.image_scale
+            )
+            self._write_file(os.path.join(job.directory, document.filename), output)
+        except Exception as e:
+            self.logger.error(f"Job {job.id} failed to render {document.name}: {e}")
+            job.errors[document.name] = str(e)
+        finally:
+            job.documents_done += 1
+
+    @staticmethod
+    def _write_file(path: str, output) -> None:
+        if isinstance(output, str):
+            output = output.encode("utf-8")
+        elif isinstance(output, io.BytesIO):
+            output = output.getbuffer()
+
+        # write then rename so a listed file is always complete
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(output)
+        os.replace(temporary_path, path)
+
+    def _write_archive(self, job: Job) -> None:
+        temporary_path = f"{job.archive_path}.tmp"
+        with zipfile.ZipFile(temporary_path, "w") as archive:
+            for document in job.documents:
+                path = os.path.join(job.directory, document.filename)
+                if not os.path.exists(path):
+                    continue
+                extension = document.filename.rsplit(".", 1)[1]
+                compression = zipfile.ZIP_STORED if extension in COMPRESSED_EXTENSIONS else zipfile.ZIP_DEFLATED
+                archive.write(path, document.filename, compress_type=compression)
+        os.replace(temporary_path, job.archive_path)
+        shutil.rmtree(job.directory)
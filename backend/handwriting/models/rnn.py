@@ -6,10 +6,10 @@ import tensorflow as tf
 
 import handwriting.utils.drawing_utils as drawing
 from handwriting.data.data_loader import DataFrame
-from handwriting.models.rnn_cell import LSTMAttentionCell
-from handwriting.models.rnn_ops import rnn_free_run
+from handwriting.models.rnn_cell import LSTMAttentionCell, LSTMAttentionCellState
+from handwriting.models.rnn_ops import rnn_free_run, rnn_free_run_chunk
 from handwriting.models.tf_base_model import TFBaseModel
-from handwriting.utils.tf_utils import time_distributed_dense_layer
+from handwriting.utils.tf_utils import HASH_MODULUS, time_distributed_dense_layer
 
 
 class DataReader(object):
@@ -145,9 +145,9 @@ class rnn(TFBaseModel):
             scope='rnn'
         )[1]
 
-    def primed_sample(self, cell):
+    def prime_state(self, cell):
         initial_state = cell.zero_state(self.num_samples, dtype=tf.float32)
-        primed_state = tf.nn.dynamic_rnn(
+        return tf.nn.dynamic_rnn(
             inputs=self.x_prime,
             cell=cell,
             sequence_length=self.x_prime_len,
@@ -155,13 +155,34 @@ class rnn(TFBaseModel):
             initial_state=initial_state,
             scope='rnn'
         )[1]
+
+    def primed_sample(self, cell):
+        return rnn_free_run(
+            cell=cell,
+            sequence_length=self.sample_tsteps,
+            initial_state=self.prime_state(cell),
+            scope='rnn'
+        )[1]
+
+    def state_sample(self, cell):
         return rnn_free_run(
             cell=cell,
             sequence_length=self.sample_tsteps,
-            initial_state=primed_state,
+            initial_state=self.initial_sample_state,
             scope='rnn'
         )[1]
 
+    def chunk_sample(self, cell):
+        return rnn_free_run_chunk(
+            cell=cell,
+            sequence_length=self.sample_tsteps,
+            initial_state=self.initial_sample_state,
+            initial_input=self.chunk_input,
+            resample_input=self.chunk_resample_input,
+            step_offset=self.chunk_step_offset,
+            scope='rnn'
+        )
+
     def calculate_loss(self):
         self.x = tf.placeholder(tf.float32, [None, None, 3])
         self.y = tf.placeholder(tf.float32, [None, None, 3])
@@ -176,6 +197,9 @@ class rnn(TFBaseModel):
         self.x_prime_len = tf.placeholder(tf.int32, [None])
         self.bias = tf.placeholder_with_default(
             tf.zeros([self.num_samples], dtype=tf.float32), [None])
+        # per-line sampling seeds, random unless fed for reproducible generations
+        self.seeds = tf.placeholder_with_default(
+            tf.random_uniform([self.num_samples], maxval=HASH_MODULUS, dtype=tf.int64), [None])
 
         cell = LSTMAttentionCell(
             lstm_size=self.lstm_size,
@@ -183,7 +207,8 @@ class rnn(TFBaseModel):
             attention_values=tf.one_hot(self.c, len(drawing.alphabet)),
             attention_values_lengths=self.c_len,
             num_output_mixture_components=self.output_mixture_components,
-            bias=self.bias
+            bias=self.bias,
+            seeds=self.seeds
         )
         self.initial_state = cell.zero_state(tf.shape(self.x)[0], dtype=tf.float32)
         outputs, self.final_state = tf.nn.dynamic_rnn(
@@ -203,4 +228,32 @@ class rnn(TFBaseModel):
             lambda: self.primed_sample(cell),
             lambda: self.sample(cell)
         )
+
+        # priming is split out so that primed states can be computed once and fed back in
+        self.primed_state = self.prime_state(cell)
+        self.initial_sample_state = LSTMAttentionCellState(
+            h1=tf.placeholder(tf.float32, [None, self.lstm_size]),
+            c1=tf.placeholder(tf.float32, [None, self.lstm_size]),
+            h2=tf.placeholder(tf.float32, [None, self.lstm_size]),
+            c2=tf.placeholder(tf.float32, [None, self.lstm_size]),
+            h3=tf.placeholder(tf.float32, [None, self.lstm_size]),
+            c3=tf.placeholder(tf.float32, [None, self.lstm_size]),
+            alpha=tf.placeholder(tf.float32, [None, self.attention_mixture_components]),
+            beta=tf.placeholder(tf.float32, [None, self.attention_mixture_components]),
+            kappa=tf.placeholder(tf.float32, [None, self.attention_mixture_components]),
+            w=tf.placeholder(tf.float32, [None, len(drawing.alphabet)]),
+            phi=tf.placeholder(tf.float32, [None, None]),
+        )
+        self.state_sampled_sequence = self.state_sample(cell)
+
+        # resumable free run used to sample a few timesteps at a time
+        self.chunk_input = tf.placeholder(tf.float32, [None, 3])
+        self.chunk_resample_input = tf.placeholder(tf.bool, [None])
+        self.chunk_step_offset = tf.placeholder_with_default(0, [])
+        (
+            self.chunk_outputs,
+            self.chunk_final_state,
+            self.chunk_final_input,
+            self.chunk_finished
+        ) = self.chunk_sample(cell)
         return self.loss
@@ -1,10 +1,9 @@
 from collections import namedtuple
 
 import tensorflow as tf
-import tensorflow.contrib.distributions as tfd
 import numpy as np
 
-from handwriting.utils.tf_utils import dense_layer, shape
+from handwriting.utils.tf_utils import dense_layer, hash_uniform, shape
 
 
 LSTMAttentionCellState = namedtuple(
@@ -23,6 +22,7 @@ class LSTMAttentionCell(tf.nn.rnn_cell.RNNCell):
         attention_values_lengths,
         num_output_mixture_components,
         bias,
+        seeds,
         reuse=None,
     ):
         self.reuse = reuse
@@ -36,6 +36,7 @@ class LSTMAttentionCell(tf.nn.rnn_cell.RNNCell):
         self.num_output_mixture_components = num_output_mixture_components
         self.output_units = 6*self.num_output_mixture_components + 1
         self.bias = bias
+        self.seeds = seeds
 
     @property
     def state_size(self):
@@ -125,35 +126,46 @@ class LSTMAttentionCell(tf.nn.rnn_cell.RNNCell):
 
             return s3_out, new_state
 
-    def output_function(self, state):
+    def output_function(self, state, step):
+        """
+        samples the next pen offset from the output mixture at timestep `step`.  every random draw
+        comes from hash_uniform on the row's seed and the step, so a seeded row is reproducible
+        regardless of batch composition or how sampling is chunked
+        """
         params = dense_layer(state.h3, self.output_units, scope='gmm', reuse=tf.AUTO_REUSE)
         pis, mus, sigmas, rhos, es = self._parse_parameters(params)
-        mu1, mu2 = tf.split(mus, 2, axis=1)
-        mus = tf.stack([mu1, mu2], axis=2)
-        sigma1, sigma2 = tf.split(sigmas, 2, axis=1)
 
-        covar_matrix = [tf.square(sigma1), rhos*sigma1*sigma2,
-                        rhos*sigma1*sigma2, tf.square(sigma2)]
-        covar_matrix = tf.stack(covar_matrix, axis=2)
-        covar_matrix = tf.reshape(covar_matrix, (self.batch_size, self.num_output_mixture_components, 2, 2))
+        # four draws per timestep: end of stroke, mixture component and two for the gaussian
+        counters = 4*tf.cast(step, tf.int64) + tf.range(4, dtype=tf.int64)
+        u_e, u_pi, u_1, u_2 = tf.unstack(hash_uniform(self.seeds, counters), axis=1)
 
-        mvn = tfd.MultivariateNormalFullCovariance(loc=mus, covariance_matrix=covar_matrix)
-        b = tfd.Bernoulli(probs=es)
-        c = tfd.Categorical(probs=pis)
-
-        sampled_e = b.sample()
-        sampled_coords = mvn.sample()
-        sampled_idx = c.sample()
+        sampled_e = tf.cast(u_e < es[:, 0], tf.float32)
 
+        # inverse cdf of the (not necessarily normalized) mixture weights
+        cdf = tf.cumsum(pis, axis=1)
+        sampled_idx = tf.reduce_sum(tf.cast(cdf < tf.expand_dims(u_pi*cdf[:, -1], 1), tf.int32), axis=1)
+        sampled_idx = tf.minimum(sampled_idx, self.num_output_mixture_components - 1)
         idx = tf.stack([tf.range(self.batch_size), sampled_idx], axis=1)
-        coords = tf.gather_nd(sampled_coords, idx)
-        return tf.concat([coords, tf.cast(sampled_e, tf.float32)], axis=1)
 
-    def termination_condition(self, state):
-        char_idx = tf.cast(tf.argmax(state.phi, axis=1), tf.int32)
+        mu1, mu2 = [tf.gather_nd(mu, idx) for mu in tf.split(mus, 2, axis=1)]
+        sigma1, sigma2 = [tf.gather_nd(sigma, idx) for sigma in tf.split(sigmas, 2, axis=1)]
+        rho = tf.gather_nd(rhos, idx)
+
+        # box-muller for two standard normals, correlated through the cholesky factor of the covariance
+        radius = tf.sqrt(-2.0*tf.log(u_1))
+        z1, z2 = radius*tf.cos(2*np.pi*u_2), radius*tf.sin(2*np.pi*u_2)
+        x = mu1 + sigma1*z1
+        y = mu2 + sigma2*(rho*z1 + tf.sqrt(1.0 - tf.square(rho))*z2)
+        return tf.stack([x, y, sampled_e], axis=1)
+
+    def termination_condition(self, state, output):
+        # only a row's own characters and the column after them count, so whether it has moved past
+        # its final character does not depend on how wide the batch is padded
+        in_reach = tf.sequence_mask(self.attention_values_lengths + 1, maxlen=self.char_len)
+        phi = tf.where(in_reach, state.phi, tf.fill(tf.shape(state.phi), -np.inf))
+        char_idx = tf.cast(tf.argmax(phi, axis=1), tf.int32)
         final_char = char_idx >= self.attention_values_lengths - 1
         past_final_char = char_idx >= self.attention_values_lengths
-        output = self.output_function(state)
         es = tf.cast(output[:, 2], tf.int32)
         is_eos = tf.equal(es, np.ones_like(es))
         return tf.logical_or(tf.logical_and(final_char, is_eos), past_final_char)
@@ -214,29 +214,34 @@ def rnn_free_run(cell, initial_state, sequence_length, initial_input=None, scope
 
     cell must implement two methods:
 
-        cell.output_function(state) which takes in the state at timestep t and returns
-        the cell input at timestep t+1.
+        cell.output_function(state, step) which takes in the state at timestep t and the
+        timestep t itself, and returns the cell input at timestep t+1.
 
-        cell.termination_condition(state) which returns a boolean tensor of shape
-        [batch_size] denoting which sequences no longer need to be sampled.
+        cell.termination_condition(state, output) which takes in the state at timestep t and
+        the input sampled from it, and returns a boolean tensor of shape [batch_size] denoting
+        which sequences no longer need to be sampled.
+
+    The output distribution is sampled once per timestep, and that sample is used both as the
+    next input and for the termination check.
     """
     with vs.variable_scope(scope, reuse=True):
         if initial_input is None:
-            initial_input = cell.output_function(initial_state)
+            initial_input = cell.output_function(initial_state, 0)
 
     def loop_fn(time, cell_output, cell_state, loop_state):
         next_cell_state = initial_state if cell_output is None else cell_state
+        sampled_input = initial_input if cell_output is None else cell.output_function(next_cell_state, time)
 
         elements_finished = math_ops.logical_or(
             time >= sequence_length,
-            cell.termination_condition(next_cell_state)
+            cell.termination_condition(next_cell_state, sampled_input)
         )
         finished = math_ops.reduce_all(elements_finished)
 
         next_input = control_flow_ops.cond(
             finished,
             lambda: array_ops.zeros_like(initial_input),
-            lambda: initial_input if cell_output is None else cell.output_function(next_cell_state)
+            lambda: sampled_input
         )
         emit_output = next_input[0] if cell_output is None else next_input
 
@@ -245,3 +250,73 @@ def rnn_free_run(cell, initial_state, sequence_length, initial_input=None, scope
 
     states, outputs, final_state = raw_rnn(cell, loop_fn, scope=scope)
     return states, outputs, final_state
+
+
+def rnn_free_run_chunk(cell, initial_state, initial_input, sequence_length, resample_input=None,
+                       step_offset=0, scope='rnn'):
+    """
+    Advances an rnn which feeds its predictions back to itself by at most sequence_length
+    timesteps, starting from an arbitrary state and input so that sampling can be resumed
+    across calls.
+
+    Sequences which meet cell.termination_condition stop updating and emit zeros for the
+    remaining timesteps.  The sample which terminates a sequence is emitted.  If resample_input
+    is given, rows where it is true replace their initial input with cell.output_function(initial_state).
+    step_offset is the number of timesteps already sampled, so that cell.output_function sees the
+    same timesteps as in an uninterrupted rnn_free_run.
+
+    returns (
+        outputs for all timesteps,
+        final cell state,
+        final input (the input for the next timestep),
+        elements finished,
+    )
+    """
+    with vs.variable_scope(scope, reuse=True):
+        if resample_input is not None:
+            initial_input = array_ops.where(
+                resample_input,
+                cell.output_function(initial_state, step_offset),
+                initial_input
+            )
+
+        time = constant_op.constant(0, dtype=dtypes.int32)
+        elements_finished = array_ops.zeros([array_ops.shape(initial_input)[0]], dtype=dtypes.bool)
+        emit_ta = tensor_array_ops.TensorArray(
+            dtype=dtypes.float32,
+            dynamic_size=True,
+            element_shape=tensor_shape.TensorShape([None, 3]),
+            size=0,
+            name="rnn_chunk_output"
+        )
+
+        def condition(time, elements_finished, *_):
+            return math_ops.logical_and(
+                time < sequence_length,
+                math_ops.logical_not(math_ops.reduce_all(elements_finished))
+            )
+
+        def body(time, elements_finished, current_input, state, emit_ta):
+            _, cell_state = cell(current_input, state)
+            sampled_input = cell.output_function(cell_state, step_offset + time + 1)
+            next_finished = math_ops.logical_or(
+                elements_finished,
+                cell.termination_condition(cell_state, sampled_input)
+            )
+
+            def copy_fn(cur_i, cand_i):
+                return array_ops.where(elements_finished, cur_i, cand_i)
+
+            next_state = nest.map_structure(copy_fn, state, cell_state)
+            next_input = copy_fn(current_input, sampled_input)
+            emit_ta = emit_ta.write(time, copy_fn(array_ops.zeros_like(sampled_input), sampled_input))
+            return (time + 1, next_finished, next_input, next_state, emit_ta)
+
+        returned = control_flow_ops.while_loop(
+            condition, body, loop_vars=[
+                time, elements_finished, initial_input, initial_state, emit_ta]
+        )
+        (_, elements_finished, final_input, final_state, emit_ta) = returned
+
+        outputs = array_ops.transpose(emit_ta.stack(), (1, 0, 2))
+        return (outputs, final_state, final_input, elements_finished)
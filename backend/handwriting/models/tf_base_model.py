@@ -47,6 +47,7 @@ class TFBaseModel(object):
         log_dir: Directory where logs are written.
         checkpoint_dir: Directory where checkpoints are saved.
         prediction_dir: Directory where predictions/outputs are saved.
+        session_config: Optional tf.ConfigProto used to create the session, e.g. to set thread counts.
     """
 
     def __init__(
@@ -71,6 +72,7 @@ class TFBaseModel(object):
         log_dir='logs',
         checkpoint_dir='handwriting/checkpoints',
         prediction_dir='handwriting/predictions',
+        session_config=None,
     ):
 
         assert len(batch_sizes) == len(learning_rates) == len(patiences)
@@ -106,7 +108,7 @@ class TFBaseModel(object):
         logging.info('\nnew run with parameters:\n{}'.format(pp.pformat(self.__dict__)))
 
         self.graph = self.build_graph()
-        self.session = tf.Session(graph=self.graph)
+        self.session = tf.Session(graph=self.graph, config=session_config)
         logging.info('built graph')
 
     def update_train_params(self):
@@ -0,0 +1,138 @@
+import numpy as np
+
+import handwriting.utils.drawing_utils as drawing
+
+# upper ends of the width per character and the height of a line over the bundled styles, in
+# offset units before stroke_scale, used to fit lines whose extent is not known yet
+MAX_CHAR_WIDTH = 8.0
+MAX_LINE_HEIGHT = 38.0
+
+
+def flatten(offsets, lengths):
+    """
+    concatenates the first lengths[i] points of every row of a padded [num_lines, T, 3] array
+    """
+    mask = np.arange(offsets.shape[1]) < np.asarray(lengths)[:, np.newaxis]
+    return offsets[mask]
+
+
+def split_lines(points, lengths):
+    """
+    splits concatenated points back into one array per line
+    """
+    return np.split(points, np.cumsum(lengths)[:-1])
+
+
+def smooth_and_align(offsets, lengths, stroke_scale):
+    """
+    converts the offsets of many lines to coordinates, then denoises and aligns all of them at once.
+    offsets are either padded [num_lines, T, 3] or already concatenated [sum(lengths), 3], and the
+    concatenated coordinates are returned
+    """
+    lengths = np.asarray(lengths)
+    offsets = flatten(offsets, lengths) if np.ndim(offsets) == 3 else offsets
+    line_ids = np.repeat(np.arange(len(lengths)), lengths)
+    line_start = np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+    # cumulative sum restarted at the beginning of every line
+    xy = offsets[:, :2].astype(np.float64) * stroke_scale
+    totals = np.cumsum(xy, axis=0)
+    xy = totals - (totals[line_start] - xy[line_start])
+
+    new_segment = (offsets[:-1, 2] == 1) | (line_ids[1:] != line_ids[:-1])
+    segment_ids = np.concatenate([[0], np.cumsum(new_segment)])
+    xy = drawing.smooth_segments(xy, segment_ids)
+
+    x, y = xy[:, 0], xy[:, 1]
+    cos, sin, offset = drawing.slant_correction(
+        lengths, _line_sums(x, lengths), _line_sums(y, lengths),
+        _line_sums(x * x, lengths), _line_sums(x * y, lengths)
+    )
+    cos, sin, offset = cos[line_ids], sin[line_ids], offset[line_ids]
+
+    coords = np.empty([len(offsets), 3], dtype=offsets.dtype)
+    coords[:, 0] = x * cos + y * sin - offset
+    coords[:, 1] = y * cos - x * sin - offset
+    coords[:, 2] = offsets[:, 2]
+    return coords
+
+
+def smooth(offsets, stroke_scale):
+    """
+    converts the offsets of a single line to coordinates and denoises them without aligning.
+    appending offsets only changes the last SAVGOL_WINDOW // 2 points, so everything before
+    them can be drawn while the line is still being sampled
+    """
+    xy = np.cumsum(offsets[:, :2].astype(np.float64) * stroke_scale, axis=0)
+    segment_ids = np.concatenate([[0], np.cumsum(offsets[:-1, 2] == 1)])
+    coords = np.empty([len(offsets), 3], dtype=offsets.dtype)
+    coords[:, :2] = drawing.smooth_segments(xy, segment_ids)
+    coords[:, 2] = offsets[:, 2]
+    return coords
+
+
+def provisional_scale(num_chars, stroke_scale, view_width, line_height, padding):
+    """
+    scale that fits a line of num_chars characters to the view before any of it is sampled,
+    assuming it is as wide and as tall as the widest and tallest writing of the styles.
+    like layout_lines it never scales up
+    """
+    width = num_chars * MAX_CHAR_WIDTH * stroke_scale
+    height = MAX_LINE_HEIGHT * stroke_scale
+    scale_x = (view_width - 2 * padding) / width if width else 1.0
+    scale_y = (line_height - padding) / height
+    return min(scale_x, scale_y, 1.0)
+
+
+def place_line(coords, position, line_height, padding, scale=1.0):
+    """
+    scales and flips unaligned line coordinates and places the start of the line at the left
+    edge of row `position`.  unlike layout_lines this does not depend on the extent of the line,
+    so points keep their place as more of the line is sampled
+    """
+    coords = np.copy(coords)
+    coords[:, 0] = coords[:, 0] * scale + padding
+    coords[:, 1] = (position + 1) * line_height - coords[:, 1] * scale
+    return coords
+
+
+def layout_lines(coords, lengths, positions, view_width, line_height, padding):
+    """
+    flips, scales and centers concatenated line coordinates to fit the view, placing
+    line i on row positions[i]
+    """
+    lengths = np.asarray(lengths)
+    line_ids = np.repeat(np.arange(len(lengths)), lengths)
+    x, y = coords[:, 0].astype(np.float64), -coords[:, 1].astype(np.float64)
+
+    x_min, x_max = _line_reduce(np.minimum, x, lengths), _line_reduce(np.maximum, x, lengths)
+    y_min, y_max = _line_reduce(np.minimum, y, lengths), _line_reduce(np.maximum, y, lengths)
+    width, height = x_max - x_min, y_max - y_min
+
+    scale_x = np.where(width != 0, (view_width - 2 * padding) / np.where(width != 0, width, 1.0), 1.0)
+    scale_y = np.where(height != 0, (line_height - padding) / np.where(height != 0, height, 1.0), 1.0)
+    scale = np.minimum(np.minimum(scale_x, scale_y), 1.0)
+
+    x_offset = (view_width - width * scale) / 2
+    y_offset = 3 * line_height / 4 + np.asarray(positions) * line_height
+
+    coords = np.copy(coords)
+    coords[:, 0] = (x - x_min[line_ids]) * scale[line_ids] + x_offset[line_ids]
+    coords[:, 1] = (y - y_min[line_ids]) * scale[line_ids] + y_offset[line_ids]
+    return coords
+
+
+def _line_sums(values, lengths):
+    return _line_reduce(np.add, values, lengths)
+
+
+def _line_reduce(ufunc, values, lengths):
+    """
+    reduces concatenated values per line, giving 0 for lines without points
+    """
+    result = np.zeros(len(lengths), dtype=values.dtype)
+    non_empty = lengths > 0
+    if non_empty.any():
+        starts = (np.cumsum(lengths) - lengths)[non_empty]
+        result[non_empty] = ufunc.reduceat(values, starts)
+    return result
@@ -0,0 +1,238 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future
+from itertools import count
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from handwriting.config import REPLICA_CONFIG, LOG_DIR, setup_logging
+
+
+def _replica_main(connection, intra_op_threads: int, inter_op_threads: int) -> None:
+    """Entry point of a replica process: restore the model, then serve requests until the pipe closes"""
+    import tensorflow as tf
+    from handwriting.sampler import StrokeSampler
+
+    setup_logging(log_file=f"{LOG_DIR}/handwriting_replica.log")
+    session_config = tf.ConfigProto(
+        intra_op_parallelism_threads=intra_op_threads,
+        inter_op_parallelism_threads=inter_op_threads,
+    )
+    sampler = StrokeSampler(session_config=session_config)
+
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+
+        task_id, method, args = message
+        try:
+            connection.send((task_id, getattr(sampler, method)(*args), None))
+        except Exception as e:
+            # tensorflow errors do not always survive pickling, so only the message is sent back
+            connection.send((task_id, None, RuntimeError(f"{type(e).__name__}: {e}")))
+
+
+class _Replica:
+    def __init__(self, context, intra_op_threads: int, inter_op_threads: int, on_exit: Optional[Callable] = None):
+        self.logger = logging.getLogger(__name__)
+        self.in_flight = 0
+        self.alive = True
+        self.on_exit = on_exit
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=_replica_main,
+            args=(child_connection, intra_op_threads, inter_op_threads),
+            daemon=True,
+        )
+        self.process.start()
+        child_connection.close()
+
+        self._pending = {}
+        self._send_lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read, name=f"replica-{self.process.pid}", daemon=True)
+        self._reader.start()
+
+    def submit(self, task_id: int, method: str, args: tuple) -> Future:
+        future = Future()
+        with self._send_lock:
+            if not self.alive:
+                raise RuntimeError(f"Replica process {self.process.pid} has exited")
+            self._pending[task_id] = future
+            try:
+                self.connection.send((task_id, method, args))
+            except (OSError, EOFError) as e:
+                del self._pending[task_id]
+                self.alive = False
+                raise RuntimeError(f"Replica process {self.process.pid} is unreachable: {e}")
+        return future
+
+    def close(self) -> None:
+        with self._send_lock:
+            if self.alive:
+                try:
+                    self.connection.send(None)
+                except (OSError, EOFError):
+                    pass
+        self.process.join()
+
+    def _read(self) -> None:
+        while True:
+            try:
+                task_id, result, error = self.connection.recv()
+            except (EOFError, OSError):
+                break
+
+            future = self._pending.pop(task_id)
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+        with self._send_lock:
+            self.alive = False
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(RuntimeError("Replica process exited before completing the request"))
+        if self.on_exit is not None:
+            self.on_exit(self)
+
+
+class ReplicaPool:
+    """Pool of worker processes, each with its own restored model and pinned session thread counts.
+
+    Exposes the same sampling interface as StrokeSampler, and sends every request to the
+    live replica with the fewest requests in flight.  A replica whose process exits is
+    skipped and replaced by a new process in the background.
+    """
+
+    def __init__(
+        self,
+        num_replicas: int,
+        intra_op_threads: int = REPLICA_CONFIG["intra_op_parallelism_threads"],
+        inter_op_threads: int = REPLICA_CONFIG["inter_op_parallelism_threads"],
+    ):
+        self.logger = logging.getLogger(__name__)
+        intra_op_threads = intra_op_threads or max((os.cpu_count() or 1) // num_replicas, 1)
+
+        self._context = multiprocessing.get_context("spawn")
+        self._intra_op_threads = intra_op_threads
+        self._inter_op_threads = inter_op_threads
+        self._closing = False
+        self._lock = threading.Lock()
+        self._replicas = [self._spawn() for _ in range(num_replicas)]
+        self._task_ids = count()
+        self._streams = {}
+        self._stream_ids = count()
+        self._style_digests = None
+        self.logger.info(f"Started {num_replicas} model replicas with {intra_op_threads} intra-op threads each")
+
+    def sample(
+        self,
+        lines: List[str],
+        biases: List[float],
+        styles: Optional[List[int]] = None,
+        seeds: Optional[List[int]] = None
+    ) -> List[np.ndarray]:
+        return self._submit(None, "sample", (lines, biases, styles, seeds)).result()
+
+    def reload_styles(self) -> None:
+        with self._lock:
+            replicas = [replica for replica in self._replicas if replica.alive]
+        futures = [self._submit(replica, "reload_styles", ()) for replica in replicas]
+        for future in futures:
+            future.result()
+        self._style_digests = None
+
+    def style_digest(self, style) -> str:
+        """Digest of a style's contents in the replicas, fetched once per reload"""
+        style_digests = self._style_digests
+        if style_digests is None:
+            style_digests = self._style_digests = self._submit(None, "style_digests", ()).result()
+        try:
+            return style_digests[style]
+        except KeyError:
+            raise ValueError(f"Error loading style {style}: style not found")
+
+    def start_stream(self, line: str, bias: float, style: Optional[int] = None, seed: Optional[int] = None) -> int:
+        """Begin an incremental stream on the least-loaded replica; later calls stay on that replica"""
+        with self._lock:
+            replica = self._least_loaded()
+        replica_stream_id = self._submit(replica, "start_stream", (line, bias, style, seed)).result()
+        with self._lock:
+            stream_id = next(self._stream_ids)
+            self._streams[stream_id] = (replica, replica_stream_id)
+        return stream_id
+
+    def advance_stream(self, stream_id: int):
+        replica, replica_stream_id = self._streams[stream_id]
+        offsets, finished = self._submit(replica, "advance_stream", (replica_stream_id,)).result()
+        if finished:
+            with self._lock:
+                self._streams.pop(stream_id, None)
+        return offsets, finished
+
+    def close_stream(self, stream_id: int) -> None:
+        with self._lock:
+            stream = self._streams.pop(stream_id, None)
+        if stream is not None:
+            replica, replica_stream_id = stream
+            self._submit(replica, "close_stream", (replica_stream_id,)).result()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._closing = True
+            replicas = list(self._replicas)
+        for replica in replicas:
+            replica.close()
+
+    def _submit(self, replica: Optional[_Replica], method: str, args: tuple) -> Future:
+        """Send a call to the given replica, or to the least-loaded one when replica is None"""
+        with self._lock:
+            if replica is None:
+                replica = self._least_loaded()
+            replica.in_flight += 1
+            task_id = next(self._task_ids)
+
+        try:
+            future = replica.submit(task_id, method, args)
+        except Exception:
+            self._release(replica)
+            raise
+        future.add_done_callback(lambda _: self._release(replica))
+        return future
+
+    def _least_loaded(self) -> _Replica:
+        live_replicas = [replica for replica in self._replicas if replica.alive]
+        if not live_replicas:
+            raise RuntimeError("No model replica is running")
+        return min(live_replicas, key=lambda r: r.in_flight)
+
+    def _spawn(self) -> _Replica:
+        return _Replica(self._context, self._intra_op_threads, self._inter_op_threads, on_exit=self._replica_exited)
+
+    def _replica_exited(self, replica: _Replica) -> None:
+        with self._lock:
+            if self._closing:
+                return
+        self.logger.error(f"Replica process {replica.process.pid} exited, starting a replacement")
+        threading.Thread(target=self._replace, args=(replica,), name="replica-respawn", daemon=True).start()
+
+    def _replace(self, replica: _Replica) -> None:
+        replacement = self._spawn()
+        with self._lock:
+            closing = self._closing
+            if not closing:
+                self._replicas[self._replicas.index(replica)] = replacement
+        if closing:
+            replacement.close()
+
+    def _release(self, replica: _Replica) -> None:
+        with self._lock:
+            replica.in_flight -= 1
@@ -0,0 +1,321 @@
+import logging
+import threading
+from dataclasses import dataclass
+from itertools import count
+
+import numpy as np
+import tensorflow as tf
+
+from handwriting.config import (
+    MODEL_CONFIG,
+    INFERENCE_CONFIG,
+    SAMPLING_CONFIG,
+    CHECKPOINT_DIR,
+    LOG_DIR,
+    PREDICTIONS_DIR,
+)
+import handwriting.utils.drawing_utils as drawing
+from handwriting.data.styles_loader import StylesLoader
+from handwriting.models.rnn import rnn
+from handwriting.models.rnn_cell import LSTMAttentionCellState
+from handwriting.utils.tf_utils import HASH_MODULUS
+
+MAX_TSTEPS_MULTIPLIER = 40
+
+
+@dataclass
+class _Stream:
+    """Sampling state of a line being sampled incrementally"""
+    chars: np.ndarray
+    chars_len: np.ndarray
+    biases: np.ndarray
+    seeds: np.ndarray
+    state: LSTMAttentionCellState
+    inputs: np.ndarray
+    resample_input: np.ndarray
+    max_tsteps: int
+    tsteps: int = 0
+
+
+class StrokeSampler:
+    """Owns a restored model session and samples stroke offsets for batches of lines.
+
+    At most `max_inflight_sessions` session.run calls execute at once; the session thread
+    pools come from INFERENCE_CONFIG unless a session_config is given.
+    """
+
+    def __init__(self, session_config=None, max_inflight_sessions=INFERENCE_CONFIG["max_inflight_sessions"]):
+        self.logger = logging.getLogger(__name__)
+        if session_config is None:
+            session_config = tf.ConfigProto(
+                intra_op_parallelism_threads=INFERENCE_CONFIG["intra_op_parallelism_threads"],
+                inter_op_parallelism_threads=INFERENCE_CONFIG["inter_op_parallelism_threads"],
+            )
+        self._session_slots = threading.BoundedSemaphore(max_inflight_sessions)
+        self.nn = rnn(
+            log_dir=LOG_DIR,
+            checkpoint_dir=CHECKPOINT_DIR,
+            prediction_dir=PREDICTIONS_DIR,
+            session_config=session_config,
+            **MODEL_CONFIG
+        )
+        self.nn.restore()
+        self.styles_loader = StylesLoader()
+        self._primed_states = {}
+        self._primed_states_lock = threading.Lock()
+        self._streams = {}
+        self._streams_lock = threading.Lock()
+        self._stream_ids = count()
+
+    def sample(self, lines, biases, styles=None, seeds=None):
+        """Sample strokes for a batch of lines, returning one offsets array per line.
+
+        Lines with a seed sample reproducibly; lines whose seed is None get a random one.
+        """
+        if SAMPLING_CONFIG["compact_finished_rows"]:
+            return self._sample_compacted(lines, biases, styles, seeds)
+
+        num_samples = len(lines)
+        max_tsteps = MAX_TSTEPS_MULTIPLIER * max(len(line) for line in lines)
+        chars, chars_len = self._encode_lines(lines, styles)
+
+        feed_dict = {
+            self.nn.num_samples: num_samples,
+            self.nn.sample_tsteps: max_tsteps,
+            self.nn.c: chars,
+            self.nn.c_len: chars_len,
+            self.nn.bias: np.asarray(biases, dtype=np.float32)
+        }
+        if seeds is not None:
+            feed_dict[self.nn.seeds] = self._seeds(seeds)
+
+        if styles is not None:
+            # free run from each style's cached primed state instead of re-priming
+            initial_state = self._initial_state(styles, num_samples, chars.shape[1])
+            feed_dict.update(zip(self.nn.initial_sample_state, initial_state))
+            sampled_sequence = self.nn.state_sampled_sequence
+        else:
+            # the primed branch of the cond is not run, but tf1 still wants its placeholders fed
+            feed_dict[self.nn.prime] = False
+            feed_dict[self.nn.x_prime] = np.zeros([num_samples, 0, 3], dtype=np.float32)
+            feed_dict[self.nn.x_prime_len] = np.zeros([num_samples], dtype=np.int32)
+            sampled_sequence = self.nn.sampled_sequence
+
+        try:
+            samples = self._run([sampled_sequence], feed_dict=feed_dict)[0]
+        except Exception as e:
+            self.logger.error(f"Error during sampling: {e}")
+            raise
+
+        # cut each line to its own step budget so its strokes do not depend on the rest of the batch
+        samples = [sample[:MAX_TSTEPS_MULTIPLIER * len(line)] for sample, line in zip(samples, lines)]
+        return [sample[~np.all(sample == 0.0, axis=1)] for sample in samples]
+
+    def _sample_compacted(self, lines, biases, styles=None, seeds=None):
+        """Sample a batch a chunk of timesteps at a time, dropping finished lines between chunks
+        so that the work per chunk tracks the number of lines still being written"""
+        num_samples = len(lines)
+        max_tsteps = MAX_TSTEPS_MULTIPLIER * np.array([len(line) for line in lines])
+        chars, chars_len = self._encode_lines(lines, styles)
+        biases = np.asarray(biases, dtype=np.float32)
+        seeds = self._seeds(seeds if seeds is not None else [None] * num_samples)
+
+        state = self._initial_state(styles, num_samples, chars.shape[1])
+        inputs = np.zeros([num_samples, 3], dtype=np.float32)
+        inputs[:, 2] = 1.0
+        resample_input = np.full([num_samples], styles is not None)
+
+        active = np.arange(num_samples)
+        tsteps = np.zeros([num_samples], dtype=np.int64)
+        outputs = [[] for _ in lines]
+
+        while len(active):
+            chunk, state, inputs, finished = self._run_chunk(
+                SAMPLING_CONFIG["chunk_tsteps"],
+                chars[active],
+                chars_len[active],
+                biases[active],
+                seeds[active],
+                # every active line has sampled the same number of timesteps so far
+                int(tsteps[active[0]]),
+                state,
+                inputs,
+                resample_input[active]
+            )
+
+            for row, sample_idx in enumerate(active):
+                outputs[sample_idx].append(chunk[row])
+            tsteps[active] += chunk.shape[1]
+            resample_input[active] = False
+
+            live = ~finished & (tsteps[active] < max_tsteps[active])
+            active = active[live]
+            inputs = inputs[live]
+            state = LSTMAttentionCellState(*[value[live] for value in state])
+
+        samples = [np.concatenate(chunks)[:limit] for chunks, limit in zip(outputs, max_tsteps)]
+        return [sample[~np.all(sample == 0.0, axis=1)] for sample in samples]
+
+    def start_stream(self, line, bias, style=None, seed=None) -> int:
+        """Begin sampling a single line incrementally, returning an id for advance_stream"""
+        styles = [style] if style is not None else None
+        chars, chars_len = self._encode_lines([line], styles)
+        inputs = np.zeros([1, 3], dtype=np.float32)
+        inputs[:, 2] = 1.0
+
+        stream = _Stream(
+            chars=chars,
+            chars_len=chars_len,
+            biases=np.array([bias], dtype=np.float32),
+            seeds=self._seeds([seed]),
+            state=self._initial_state(styles, 1, chars.shape[1]),
+            inputs=inputs,
+            resample_input=np.array([style is not None]),
+            max_tsteps=MAX_TSTEPS_MULTIPLIER * len(line)
+        )
+        with self._streams_lock:
+            stream_id = next(self._stream_ids)
+            self._streams[stream_id] = stream
+        return stream_id
+
+    def advance_stream(self, stream_id):
+        """Sample the next few timesteps of a stream, returning (offsets, finished).
+
+        The stream is closed once finished.
+        """
+        with self._streams_lock:
+            stream = self._streams[stream_id]
+
+        chunk, stream.state, stream.inputs, finished = self._run_chunk(
+            SAMPLING_CONFIG["stream_chunk_tsteps"],
+            stream.chars,
+            stream.chars_len,
+            stream.biases,
+            stream.seeds,
+            stream.tsteps,
+            stream.state,
+            stream.inputs,
+            stream.resample_input
+        )
+        chunk = chunk[0][:stream.max_tsteps - stream.tsteps]
+        stream.tsteps += len(chunk)
+        stream.resample_input = np.array([False])
+
+        finished = bool(finished[0]) or stream.tsteps >= stream.max_tsteps
+        if finished:
+            self.close_stream(stream_id)
+        return chunk[~np.all(chunk == 0.0, axis=1)], finished
+
+    def close_stream(self, stream_id) -> None:
+        with self._streams_lock:
+            self._streams.pop(stream_id, None)
+
+    def _run_chunk(self, tsteps, chars, chars_len, biases, seeds, step_offset, state, inputs, resample_input):
+        """Advance a batch of lines by up to tsteps, returning (outputs, state, inputs, finished)"""
+        feed_dict = {
+            self.nn.num_samples: len(chars),
+            self.nn.sample_tsteps: tsteps,
+            self.nn.c: chars,
+            self.nn.c_len: chars_len,
+            self.nn.bias: biases,
+            self.nn.seeds: seeds,
+            self.nn.chunk_step_offset: step_offset,
+            self.nn.chunk_input: inputs,
+            self.nn.chunk_resample_input: resample_input
+        }
+        feed_dict.update(zip(self.nn.initial_sample_state, state))
+
+        try:
+            chunk, state, inputs, finished = self._run(
+                [self.nn.chunk_outputs, self.nn.chunk_final_state,
+                 self.nn.chunk_final_input, self.nn.chunk_finished],
+                feed_dict=feed_dict
+            )
+        except Exception as e:
+            self.logger.error(f"Error during sampling: {e}")
+            raise
+        return chunk, LSTMAttentionCellState(*state), inputs, finished
+
+    @staticmethod
+    def _seeds(seeds):
+        """Seed feed for a batch, drawing a random seed for lines without one"""
+        return np.array(
+            [seed if seed is not None else np.random.randint(HASH_MODULUS) for seed in seeds],
+            dtype=np.int64
+        )
+
+    def _encode_lines(self, lines, styles=None):
+        """Encode lines (prefixed with their style's characters when primed) into the char feed"""
+        if styles is not None:
+            encoded_lines = [self.styles_loader.load_style(line, style)[1] for line, style in zip(lines, styles)]
+        else:
+            encoded_lines = [drawing.encode_ascii(line) for line in lines]
+
+        # sized to the longest line in the batch so the attention window stays as small as possible,
+        # plus the spare column the termination condition needs to see attention move past the end
+        chars_len = np.array([len(encoded) for encoded in encoded_lines], dtype=np.int32)
+        chars = np.zeros([len(lines), chars_len.max() + 1], dtype=np.int32)
+        for i, encoded in enumerate(encoded_lines):
+            chars[i, :len(encoded)] = encoded
+
+        return chars, chars_len
+
+    def _initial_state(self, styles, num_samples, char_len) -> LSTMAttentionCellState:
+        """Stack the cached primed state of each line's style, or zeros when unprimed"""
+        if styles is not None:
+            primed_states = [self._primed_state(style) for style in styles]
+            initial_state = LSTMAttentionCellState(*[np.concatenate(values) for values in zip(*primed_states)])
+        else:
+            lstm_state = np.zeros([num_samples, self.nn.lstm_size], dtype=np.float32)
+            attention_state = np.zeros([num_samples, self.nn.attention_mixture_components], dtype=np.float32)
+            initial_state = LSTMAttentionCellState(
+                *([lstm_state] * 6 + [attention_state] * 3),
+                w=np.zeros([num_samples, len(drawing.alphabet)], dtype=np.float32),
+                phi=None
+            )
+        return initial_state._replace(phi=np.zeros([num_samples, char_len], dtype=np.float32))
+
+    def style_digest(self, style) -> str:
+        """Digest of a style's contents, which changes whenever the style is replaced"""
+        return self.styles_loader.digest(style)
+
+    def style_digests(self) -> dict:
+        return self.styles_loader.digests()
+
+    def reload_styles(self) -> None:
+        """Reload the style bank and drop primed states computed from the old styles"""
+        self.styles_loader.reload()
+        with self._primed_states_lock:
+            self._primed_states.clear()
+
+    def _primed_state(self, style) -> LSTMAttentionCellState:
+        """Return the LSTM attention state after priming on a style, computing it once per style.
+
+        Priming only runs the recurrent cell, so the state does not depend on the bias.
+        """
+        with self._primed_states_lock:
+            # keyed on the digest too, so a style replaced by add_style is primed afresh
+            key = (style, self.styles_loader.digest(style))
+            if key in self._primed_states:
+                return self._primed_states[key]
+
+        strokes, encoded = self.styles_loader.load_prime(style)
+        encoded = encoded.astype(np.int32)
+        primed_state = self._run(
+            self.nn.primed_state,
+            feed_dict={
+                self.nn.num_samples: 1,
+                self.nn.x_prime: strokes[np.newaxis],
+                self.nn.x_prime_len: np.array([len(strokes)], dtype=np.int32),
+                self.nn.c: encoded[np.newaxis],
+                self.nn.c_len: np.array([len(encoded)], dtype=np.int32)
+            }
+        )
+
+        with self._primed_states_lock:
+            self._primed_states[key] = primed_state
+        return primed_state
+
+    def _run(self, fetches, feed_dict):
+        with self._session_slots:
+            return self.nn.session.run(fetches, feed_dict=feed_dict)
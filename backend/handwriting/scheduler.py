@@ -0,0 +1,144 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from handwriting.config import SCHEDULER_CONFIG
+
+
+@dataclass
+class SampleRequest:
+    line: str
+    style: Optional[int]
+    bias: float
+    seed: Optional[int] = None
+    future: Future = field(default_factory=Future)
+
+
+def bucket_by_length(requests: List[SampleRequest], bucket_width: int) -> List[List[SampleRequest]]:
+    """Group requests into buckets of similar line length, shortest lines first"""
+    if not bucket_width:
+        return [requests]
+
+    buckets = {}
+    for request in requests:
+        buckets.setdefault(len(request.line) // bucket_width, []).append(request)
+    return [buckets[key] for key in sorted(buckets)]
+
+
+class BatchScheduler:
+    """Collects lines from concurrent requests and samples them as shared batches.
+
+    Lines submitted within `batch_window` seconds of each other (up to `max_batch_size`)
+    are handed to `sample_fn` and each line's strokes are routed back to the future
+    returned by `submit`. Within a batch, lines are sampled per length bucket so short
+    lines do not pay for the attention window and step budget of the longest one.
+
+    Up to `max_concurrent_batches` batches are sampled at once (one per model replica);
+    while all of them are busy, new lines keep queueing and are batched together.
+    """
+
+    def __init__(
+        self,
+        sample_fn: Callable[[List[str], List[float], Optional[List[int]], Optional[List[int]]], List[np.ndarray]],
+        max_batch_size: int = SCHEDULER_CONFIG["max_batch_size"],
+        batch_window: float = SCHEDULER_CONFIG["batch_window"],
+        length_bucket_width: int = SCHEDULER_CONFIG["length_bucket_width"],
+        max_concurrent_batches: int = 1,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.sample_fn = sample_fn
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window
+        self.length_bucket_width = length_bucket_width
+
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._batch_slots = threading.BoundedSemaphore(max_concurrent_batches)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_batches)
+        self._worker = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+        self._worker.start()
+
+    def submit(self, line: str, style: Optional[int] = None, bias: float = 0.5, seed: Optional[int] = None) -> Future:
+        """Queue a single line for sampling and return a future for its strokes"""
+        request = SampleRequest(line=line, style=style, bias=bias, seed=seed)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Batch scheduler has been shut down")
+            self._pending.append(request)
+            self._condition.notify()
+        return request.future
+
+    def shutdown(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._worker.join()
+        self._executor.shutdown()
+
+    def _next_batch(self) -> Optional[List[SampleRequest]]:
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait()
+            if not self._pending:
+                return None
+
+            deadline = time.monotonic() + self.batch_window
+            while len(self._pending) < self.max_batch_size and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            batch_size = min(len(self._pending), self.max_batch_size)
+            return [self._pending.popleft() for _ in range(batch_size)]
+
+    def _run(self) -> None:
+        while True:
+            self._batch_slots.acquire()
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch: List[SampleRequest]) -> None:
+        try:
+            self._sample_batch(batch)
+        finally:
+            self._batch_slots.release()
+
+    def _sample_batch(self, batch: List[SampleRequest]) -> None:
+        # primed and unprimed lines take different branches of the sampling graph
+        groups = {}
+        for request in batch:
+            groups.setdefault(request.style is None, []).append(request)
+
+        for unprimed, requests in groups.items():
+            requests = [r for r in requests if r.future.set_running_or_notify_cancel()]
+            for bucket in bucket_by_length(requests, self.length_bucket_width):
+                if bucket:
+                    self._sample_bucket(bucket, unprimed)
+
+    def _sample_bucket(self, requests: List[SampleRequest], unprimed: bool) -> None:
+        self.logger.debug(f"Dispatching batch of {len(requests)} lines")
+        seeded = any(r.seed is not None for r in requests)
+        try:
+            strokes = self.sample_fn(
+                [r.line for r in requests],
+                [r.bias for r in requests],
+                None if unprimed else [r.style for r in requests],
+                [r.seed for r in requests] if seeded else None,
+            )
+        except Exception as e:
+            for request in requests:
+                request.future.set_exception(e)
+            return
+
+        for request, line_strokes in zip(requests, strokes):
+            request.future.set_result(line_strokes)
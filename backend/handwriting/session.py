@@ -0,0 +1,136 @@
+import asyncio
+import logging
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+import handwriting.utils.drawing_utils as drawing
+from handwriting.generator import Hand, DEFAULT_STROKE_COLOR
+
+SAMPLING_SETTINGS = ("style", "bias", "seed")
+PRESENTATION_SETTINGS = ("stroke_color", "stroke_width")
+
+
+class HandwritingSession:
+    """A document edited line by line over a long-lived connection.
+
+    The samples of every line are kept, so an edit only resamples the lines it changes.
+    Lines that merely move (after an insert or delete) or change color or width are
+    re-laid out from their existing samples, and the style's primed state is reused
+    by the sampler across all of them.
+    """
+
+    def __init__(
+        self,
+        hand: Hand,
+        style: Optional[int] = None,
+        bias: float = 0.5,
+        stroke_color: str = DEFAULT_STROKE_COLOR,
+        stroke_width: Optional[float] = None,
+        seed: Optional[int] = None,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.hand = hand
+        self.style = style
+        self.bias = bias
+        self.stroke_color = stroke_color
+        self.stroke_width = stroke_width or hand.stroke_config.default_stroke_width
+        self.seed = seed
+        self.lines: List[str] = []
+        self._samples: List[Optional[Future]] = []
+        self._valid_char_set = set(drawing.alphabet)
+
+    def configure(self, **settings) -> List[int]:
+        """Change session settings, returning the lines that have to be re-rendered"""
+        unknown = set(settings) - set(SAMPLING_SETTINGS + PRESENTATION_SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown session settings: {sorted(unknown)}")
+
+        changed = {name for name, value in settings.items() if getattr(self, name) != value}
+        for name in changed:
+            setattr(self, name, settings[name])
+
+        if changed & set(SAMPLING_SETTINGS):
+            for index, line in enumerate(self.lines):
+                self._resample(index, line)
+        return list(range(len(self.lines))) if changed else []
+
+    def insert(self, index: int, text: str) -> List[int]:
+        self._check_index(index, allow_end=True)
+        self.hand._validate_input([text], self._valid_char_set)
+        self.lines.insert(index, text)
+        self._samples.insert(index, None)
+        self._resample(index, text)
+        return list(range(index, len(self.lines)))
+
+    def edit(self, index: int, text: str) -> List[int]:
+        self._check_index(index)
+        if self.lines[index] == text:
+            return []
+        self.hand._validate_input([text], self._valid_char_set)
+        self.lines[index] = text
+        self._resample(index, text)
+        return [index]
+
+    def delete(self, index: int) -> List[int]:
+        self._check_index(index)
+        del self.lines[index]
+        future = self._samples.pop(index)
+        if future is not None:
+            future.cancel()
+        return list(range(index, len(self.lines)))
+
+    def close(self) -> None:
+        for future in self._samples:
+            if future is not None:
+                future.cancel()
+
+    async def render(self, indices: List[int]) -> List[Dict[str, Any]]:
+        """Events redrawing the given lines, preceded by the (possibly resized) view"""
+        line_height = self.hand.stroke_config.line_height
+        view_width = self.hand.stroke_config.view_width
+        view_height = line_height * (len(self.lines) + 1)
+        events = [{
+            'type': 'setup',
+            'viewBox': f"0 0 {view_width} {view_height}",
+            'width': view_width,
+            'height': view_height,
+            'lines': len(self.lines)
+        }]
+
+        samples = {}
+        for index in indices:
+            if self._samples[index] is not None:
+                try:
+                    samples[index] = await asyncio.wrap_future(self._samples[index])
+                except Exception:
+                    # queue the line again so that the next render retries it instead of failing for good
+                    self._resample(index, self.lines[index])
+                    raise
+
+        rows = [index for index in indices if index in samples and len(samples[index])]
+        loop = asyncio._get_running_loop()
+        coords = await loop.run_in_executor(
+            self.hand._executor, self.hand._process_lines, [samples[index] for index in rows], rows
+        )
+        line_coords = dict(zip(rows, coords))
+
+        for index in indices:
+            events.append({
+                'type': 'line',
+                'lineNumber': index,
+                'data': self.hand._path_data(line_coords[index], view_height) if index in line_coords else '',
+                'color': self.stroke_color,
+                'width': self.stroke_width
+            })
+        return events
+
+    def _resample(self, index: int, text: str) -> None:
+        previous = self._samples[index]
+        if previous is not None:
+            previous.cancel()
+        self._samples[index] = self.hand._submit_line(text, self.style, self.bias, self.seed) if text else None
+
+    def _check_index(self, index: int, allow_end: bool = False) -> None:
+        upper = len(self.lines) if allow_end else len(self.lines) - 1
+        if not 0 <= index <= upper:
+            raise IndexError(f"Line index {index} out of range for a document of {len(self.lines)} lines")
@@ -0,0 +1,41 @@
+"""
+parses css colors for the writers that draw them themselves (pdf and raster), so they show the
+same color a browser would for the svg output
+"""
+import re
+
+from PIL import ImageColor
+
+# rgb()/rgba() with an alpha, which pillow does not parse: comma or space separated channels,
+# alpha after a comma or a slash, as a number or a percentage
+RGBA_PATTERN = re.compile(
+    r'^rgba?\(\s*([\d.]+%?)\s*[,\s]\s*([\d.]+%?)\s*[,\s]\s*([\d.]+%?)\s*[,/]\s*([\d.]+%?)\s*\)$'
+)
+
+
+def parse_color(color):
+    """
+    returns (red, green, blue, alpha) of a css color, each between 0 and 1.  raises ValueError
+    for colors that cannot be parsed
+    """
+    color = color.strip().lower()
+    if color == 'transparent':
+        return 0.0, 0.0, 0.0, 0.0
+
+    match = RGBA_PATTERN.match(color)
+    if match:
+        red, green, blue = (_channel(value, 255) for value in match.groups()[:3])
+        return red, green, blue, _channel(match.group(4), 1)
+
+    try:
+        rgb = ImageColor.getrgb(color)
+    except ValueError:
+        raise ValueError(f"Unsupported color {color!r}")
+    alpha = rgb[3] / 255 if len(rgb) == 4 else 1.0
+    return rgb[0] / 255, rgb[1] / 255, rgb[2] / 255, alpha
+
+
+def _channel(value, scale):
+    if value.endswith('%'):
+        return min(float(value[:-1]) / 100, 1.0)
+    return min(float(value) / scale, 1.0)
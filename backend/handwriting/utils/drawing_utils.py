@@ -1,9 +1,10 @@
 from __future__ import print_function
 from collections import defaultdict
+from itertools import chain
 
 import matplotlib.pyplot as plt
 import numpy as np
-from scipy.signal import savgol_filter
+from scipy.signal import savgol_coeffs
 from scipy.interpolate import interp1d
 
 
@@ -23,24 +24,35 @@ num_to_alpha = dict(enumerate(alphabet_ord))
 MAX_STROKE_LEN = 1200
 MAX_CHAR_LEN = 75
 
+SAVGOL_WINDOW = 7
+SAVGOL_KERNEL = savgol_coeffs(SAVGOL_WINDOW, 3)
+
 
 def align(coords):
     """
     corrects for global slant/offset in handwriting strokes
     """
     coords = np.copy(coords)
-    X, Y = coords[:, 0].reshape(-1, 1), coords[:, 1].reshape(-1, 1)
-    X = np.concatenate([np.ones([X.shape[0], 1]), X], axis=1)
-    offset, slope = np.linalg.inv(X.T.dot(X)).dot(X.T).dot(Y).squeeze()
-    theta = np.arctan(slope)
-    rotation_matrix = np.array(
-        [[np.cos(theta), -np.sin(theta)],
-         [np.sin(theta), np.cos(theta)]]
-    )
-    coords[:, :2] = np.dot(coords[:, :2], rotation_matrix) - offset
+    x, y = coords[:, 0].astype(np.float64), coords[:, 1].astype(np.float64)
+    cos, sin, offset = slant_correction(len(coords), x.sum(), y.sum(), x.dot(x), x.dot(y))
+    coords[:, 0], coords[:, 1] = x * cos + y * sin - offset, y * cos - x * sin - offset
     return coords
 
 
+def slant_correction(n, sum_x, sum_y, sum_xx, sum_xy):
+    """
+    closed form least squares fit of y = offset + slope * x from running sums, returned as the
+    rotation (cos, sin) that levels the fitted line and the offset to subtract afterwards
+    """
+    n = np.asarray(n, dtype=np.float64)
+    denominator = n * sum_xx - sum_x * sum_x
+    degenerate = denominator == 0
+    slope = np.where(degenerate, 0.0, (n * sum_xy - sum_x * sum_y) / np.where(degenerate, 1.0, denominator))
+    offset = (sum_y - slope * sum_x) / np.maximum(n, 1.0)
+    theta = np.arctan(slope)
+    return np.cos(theta), np.sin(theta), offset
+
+
 def skew(coords, degrees):
     """
     skews strokes by given degrees
@@ -81,18 +93,35 @@ def denoise(coords):
     """
     smoothing filter to mitigate some artifacts of the data collection
     """
-    coords = np.split(coords, np.where(coords[:, 2] == 1)[0] + 1, axis=0)
-    new_coords = []
-    for stroke in coords:
-        if len(stroke) != 0:
-            x_new = savgol_filter(stroke[:, 0], 7, 3, mode='nearest')
-            y_new = savgol_filter(stroke[:, 1], 7, 3, mode='nearest')
-            xy_coords = np.hstack([x_new.reshape(-1, 1), y_new.reshape(-1, 1)])
-            stroke = np.concatenate([xy_coords, stroke[:, 2].reshape(-1, 1)], axis=1)
-            new_coords.append(stroke)
+    stroke_ids = np.concatenate([[0], np.cumsum(coords[:-1, 2] == 1)])
+    xy_coords = smooth_segments(coords[:, :2], stroke_ids)
+    return np.concatenate([xy_coords.astype(coords.dtype), coords[:, 2:3]], axis=1)
 
-    coords = np.vstack(new_coords)
-    return coords
+
+def smooth_segments(values, segment_ids):
+    """
+    savitzky-golay smoothing (window 7, order 3) applied independently to each run of equal
+    segment ids, with every segment extended by its edge values (mode='nearest')
+    """
+    num_points = len(values)
+    if num_points == 0:
+        return np.zeros_like(values, dtype=np.float64)
+
+    boundaries = np.flatnonzero(np.diff(segment_ids)) + 1
+    starts = np.concatenate([[0], boundaries])
+    ends = np.concatenate([boundaries, [num_points]]) - 1
+    lengths = ends - starts + 1
+    segment_start = np.repeat(starts, lengths)
+    segment_end = np.repeat(ends, lengths)
+
+    values = np.asarray(values, dtype=np.float64)
+    positions = np.arange(num_points)
+    smoothed = np.zeros_like(values)
+    half_window = SAVGOL_WINDOW // 2
+    for shift, weight in zip(range(-half_window, half_window + 1), SAVGOL_KERNEL[::-1]):
+        neighbours = np.minimum(np.maximum(positions + shift, segment_start), segment_end)
+        smoothed += weight * values[neighbours]
+    return smoothed
 
 
 def interpolate(coords, factor=2):
@@ -154,6 +183,36 @@ def offsets_to_coords(offsets):
     return np.concatenate([np.cumsum(offsets[:, :2], axis=0), offsets[:, 2:3]], axis=1)
 
 
+def svg_path(coords, bounds=None, precision=2, relative=False):
+    """
+    serializes strokes to svg path data, starting a new subpath after every end of stroke.
+    bounds ((x_min, y_min), (x_max, y_max)) clamps the points, and relative encodes every
+    point after the first as an offset from the previous one
+    """
+    if len(coords) == 0:
+        return ''
+
+    xy = coords[:, :2]
+    if bounds is not None:
+        xy = np.clip(xy, bounds[0], bounds[1])
+
+    pen_up = np.concatenate([[True], coords[:-1, 2] == 1.0])
+    scale = 10 ** precision
+    # round before differencing so relative offsets never accumulate rounding error
+    xy = np.round(xy * scale)
+    if relative:
+        xy[1:] = np.diff(xy, axis=0)
+        commands = np.where(pen_up, 'm', 'l')
+        commands[0] = 'M'
+    else:
+        commands = np.where(pen_up, 'M', 'L')
+    xy /= scale
+
+    template = '%s%.{0}f,%.{0}f'.format(precision)
+    values = chain.from_iterable(zip(commands.tolist(), xy[:, 0].tolist(), xy[:, 1].tolist()))
+    return ' '.join([template] * len(xy)) % tuple(values)
+
+
 def draw(
         offsets,
         ascii_seq=None,
@@ -0,0 +1,180 @@
+"""
+writes laid-out strokes straight to pdf path operators, without an intermediate svg.
+
+coordinates are given in view units (css pixels, y down) and mapped onto pdf points (y up) by the
+page transform, so the same arrays that feed svg_path can be drawn unchanged.  every page is
+written to the output as soon as it ends, and only the object offsets are kept until the cross
+reference table is written by save, so memory stays bounded by a single page
+"""
+import zlib
+from itertools import chain
+
+import numpy as np
+
+from handwriting.utils.color_utils import parse_color
+
+# svg user units are css pixels at 96 dpi, pdf units are points at 72 dpi
+POINTS_PER_PIXEL = 72 / 96
+
+# page sizes in points
+PAGE_SIZES = {
+    "a4": (595.28, 841.89),
+    "a5": (419.53, 595.28),
+    "letter": (612.0, 792.0),
+    "legal": (612.0, 1008.0),
+}
+
+CATALOG_OBJECT = 1
+PAGES_OBJECT = 2
+
+
+def path_operators(coords, bounds=None, precision=2):
+    """
+    serializes strokes to pdf path construction operators, starting a new subpath after every end
+    of stroke.  bounds ((x_min, y_min), (x_max, y_max)) clamps the points
+    """
+    if len(coords) == 0:
+        return ''
+
+    xy = coords[:, :2]
+    if bounds is not None:
+        xy = np.clip(xy, bounds[0], bounds[1])
+    xy = np.round(xy, precision)
+
+    pen_up = np.concatenate([[True], coords[:-1, 2] == 1.0])
+    operators = np.where(pen_up, 'm', 'l')
+
+    template = '%.{0}f %.{0}f %s'.format(precision)
+    values = chain.from_iterable(zip(xy[:, 0].tolist(), xy[:, 1].tolist(), operators.tolist()))
+    return '\n'.join([template] * len(xy)) % tuple(values)
+
+
+def lines_per_page(page_size, margin, view_width, line_height):
+    """number of lines that fit on a page when the view is scaled to the width between the margins"""
+    page_width, page_height = page_size
+    scale = (page_width - 2 * margin) / view_width
+    return max(int((page_height - 2 * margin) / (scale * line_height)) - 1, 1)
+
+
+def _color_operands(color):
+    """rgb operands and alpha of a css color"""
+    red, green, blue, alpha = parse_color(color)
+    return '%.4f %.4f %.4f' % (red, green, blue), alpha
+
+
+class PDFWriter:
+    """Writes pages of strokes to a binary file object as a pdf, one page at a time"""
+
+    def __init__(self, output, precision=2):
+        self.output = output
+        self.precision = precision
+        self.pages = []
+        self._offsets = {}
+        self._position = 0
+        self._next_object = PAGES_OBJECT + 1
+        self._page = None
+        self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def begin_page(self, view_width, view_height, page_size=None, margin=0, background='white'):
+        """
+        starts a page showing the view ((0, 0), (view_width, view_height)), clipped to it.  without
+        a page_size the page is the view at 96 dpi, otherwise the view is scaled to fit inside the
+        margins of a (width, height) page in points and placed at its top left
+        """
+        if self._page is not None:
+            self.end_page()
+
+        if page_size is None:
+            scale = POINTS_PER_PIXEL
+            margin = 0
+            page_size = (view_width * scale, view_height * scale)
+        else:
+            scale = min((page_size[0] - 2 * margin) / view_width, (page_size[1] - 2 * margin) / view_height)
+
+        self._page = {'size': page_size, 'alphas': {}, 'content': [
+            'q',
+            '%.6f 0 0 %.6f %.4f %.4f cm' % (scale, -scale, margin, page_size[1] - margin),
+            '0 0 %g %g re W n' % (view_width, view_height),
+        ]}
+        if background is not None:
+            operands, alpha = _color_operands(background)
+            if alpha > 0:
+                self._page['content'].append('%s%s rg 0 0 %g %g re f' % (
+                    self._alpha_operator(alpha, 'ca'), operands, view_width, view_height
+                ))
+        self._page['content'].append('1 J 1 j')
+
+    def draw_strokes(self, coords, color, width, bounds=None):
+        """strokes coords of shape [n, 3] (x, y, end of stroke) in view units"""
+        operands, alpha = _color_operands(color)
+        operators = path_operators(coords, bounds=bounds, precision=self.precision)
+        if not operators or alpha == 0:
+            return
+        self._page['content'].extend([
+            '%s%s RG %g w' % (self._alpha_operator(alpha, 'CA'), operands, width),
+            operators,
+            'S',
+        ])
+
+    def _alpha_operator(self, alpha, key):
+        """
+        sets the stroke (CA) or fill (ca) alpha through a graphics state of the page, which is
+        only needed for translucent colors.  every stroke sets it, so it never leaks to the next
+        """
+        states = self._page['alphas']
+        if alpha >= 1 and not states:
+            return ''
+        name = states.setdefault((key, round(alpha, 4)), 'GS%d' % len(states))
+        return '/%s gs ' % name
+
+    def end_page(self):
+        if self._page is None:
+            return
+        self._page['content'].append('Q')
+        content = zlib.compress('\n'.join(self._page['content']).encode('ascii'))
+
+        content_object = self._write_object(
+            b'<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(content) + content + b'\nendstream'
+        )
+        width, height = self._page['size']
+        states = ' '.join(
+            '/%s << /%s %.4f >>' % (name, key, alpha) for (key, alpha), name in self._page['alphas'].items()
+        )
+        resources = '<< /ExtGState << %s >> >>' % states if states else '<< >>'
+        page_object = self._write_object((
+            '<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.2f %.2f] /Resources %s /Contents %d 0 R >>'
+            % (PAGES_OBJECT, width, height, resources, content_object)
+        ).encode('ascii'))
+        self.pages.append(page_object)
+        self._page = None
+
+    def save(self):
+        """ends the open page and writes the page tree, catalog and cross reference table"""
+        self.end_page()
+        if not self.pages:
+            raise ValueError("A PDF needs at least one page")
+
+        kids = ' '.join('%d 0 R' % page for page in self.pages)
+        self._write_object(
+            ('<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(self.pages))).encode('ascii'), PAGES_OBJECT
+        )
+        self._write_object(('<< /Type /Catalog /Pages %d 0 R >>' % PAGES_OBJECT).encode('ascii'), CATALOG_OBJECT)
+
+        xref_position = self._position
+        size = self._next_object
+        xref = ['xref', '0 %d' % size, '0000000000 65535 f ']
+        xref.extend('%010d 00000 n ' % self._offsets[number] for number in range(1, size))
+        trailer = ['trailer', '<< /Size %d /Root %d 0 R >>' % (size, CATALOG_OBJECT), 'startxref', str(xref_position), '%%EOF']
+        self._write(('\n'.join(xref + trailer) + '\n').encode('ascii'))
+
+    def _write_object(self, body, number=None):
+        if number is None:
+            number = self._next_object
+            self._next_object += 1
+        self._offsets[number] = self._position
+        self._write(b'%d 0 obj\n' % number + body + b'\nendobj\n')
+        return number
+
+    def _write(self, data):
+        self.output.write(data)
+        self._position += len(data)
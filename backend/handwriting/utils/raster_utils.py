@@ -0,0 +1,91 @@
+"""
+draws laid-out strokes to bitmaps with pillow.
+
+every line is drawn on its own tile as an antialiased coverage mask, supersampled and reduced, so
+the tiles of lines that were drawn before can be reused and only colored and pasted when a
+document is composed
+"""
+import io
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from handwriting.utils.color_utils import parse_color
+
+SUPERSAMPLE = 4
+
+# pillow format names of the supported output formats
+IMAGE_FORMATS = {
+    "png": "PNG",
+    "webp": "WEBP",
+}
+IMAGE_MEDIA_TYPES = {
+    "png": "image/png",
+    "webp": "image/webp",
+}
+
+
+def tile_points(coords, width, scale=1.0, bounds=None):
+    """
+    places coords of shape [n, 3] (x, y, end of stroke) on the pixel grid of a tile.  returns the top
+    left corner of the tile in output pixels and the points in supersampled tile pixels, which only
+    depend on the shape of the line and its sub-pixel offset, so they can key a tile cache
+    """
+    xy = coords[:, :2]
+    if bounds is not None:
+        xy = np.clip(xy, bounds[0], bounds[1])
+    xy = xy * scale
+
+    origin = np.floor(xy.min(axis=0) - _padding(width, scale)).astype(np.int64)
+    points = np.round((xy - origin) * SUPERSAMPLE).astype(np.int32)
+    return (int(origin[0]), int(origin[1])), points
+
+
+def draw_tile(points, end_of_stroke, width, scale=1.0):
+    """
+    draws tile points from tile_points as round capped and joined strokes, returning an 'L' image
+    of their coverage
+    """
+    size = np.ceil(points.max(axis=0) / SUPERSAMPLE + _padding(width, scale)).astype(np.int64)
+    mask = Image.new('L', (int(size[0]) * SUPERSAMPLE, int(size[1]) * SUPERSAMPLE), 0)
+    draw = ImageDraw.Draw(mask)
+
+    line_width = max(int(round(width * scale * SUPERSAMPLE)), 1)
+    radius = line_width / 2
+    stroke_ends = np.where(end_of_stroke[:-1] == 1.0)[0] + 1
+    for stroke in np.split(points, stroke_ends):
+        stroke = [tuple(point) for point in stroke.tolist()]
+        if len(stroke) > 1:
+            draw.line(stroke, fill=255, width=line_width, joint='curve')
+        for x, y in (stroke[0], stroke[-1]):
+            draw.ellipse([x - radius, y - radius, x + radius, y + radius], fill=255)
+
+    return mask.reduce(SUPERSAMPLE)
+
+
+def compose(size, tiles, background='white'):
+    """
+    pastes (origin, mask, color) tiles in order onto an RGB image of size (width, height).  colors
+    are css colors, and translucent ones are blended by their alpha
+    """
+    image = Image.new('RGB', size, background)
+    for (x, y), mask, color in tiles:
+        red, green, blue, alpha = parse_color(color)
+        if alpha == 0:
+            continue
+        if alpha < 1:
+            mask = mask.point(lambda coverage: int(round(coverage * alpha)))
+        fill = tuple(int(round(channel * 255)) for channel in (red, green, blue))
+        image.paste(fill, (x, y, x + mask.width, y + mask.height), mask)
+    return image
+
+
+def encode(image, image_format, quality=90):
+    output = io.BytesIO()
+    image.save(output, format=IMAGE_FORMATS[image_format], quality=quality)
+    return output.getvalue()
+
+
+def _padding(width, scale):
+    # half the stroke plus a pixel for the antialiased edge
+    return width * scale / 2 + 1
@@ -0,0 +1,70 @@
+"""
+compact binary framing for streamed strokes, an alternative to SSE events with SVG path strings.
+
+every frame is a little-endian uint32 length (of everything after it), a uint8 frame type and
+a payload:
+
+    SETUP   uint32 view width, uint32 view height, uint32 number of lines, uint16 units per pixel
+    LINE    uint32 line number, float32 stroke width, uint8 color length, utf-8 color
+    POINTS  uint32 line number, uint32 point count n, int32 x0, int32 y0,
+            (n - 1) int16 (dx, dy) pairs, ceil(n / 8) bytes of pen-up bits (msb first)
+    ERROR   utf-8 message
+    DONE    empty
+
+coordinates are in 1 / units-per-pixel pixels.  the first point of a POINTS frame is absolute and
+the rest are deltas from the previous point.  a set pen-up bit means the pen lifts after that point,
+so the segment to the next point is not drawn
+"""
+import struct
+
+import numpy as np
+
+BINARY_MEDIA_TYPE = "application/x-penman-strokes"
+UNITS_PER_PIXEL = 10
+
+FRAME_SETUP = 1
+FRAME_LINE = 2
+FRAME_POINTS = 3
+FRAME_ERROR = 4
+FRAME_DONE = 5
+
+INT16_MAX = np.iinfo(np.int16).max
+
+
+def frame(frame_type, payload=b''):
+    return struct.pack('<IB', len(payload) + 1, frame_type) + payload
+
+
+def setup_frame(view_width, view_height, num_lines):
+    return frame(FRAME_SETUP, struct.pack('<IIIH', view_width, view_height, num_lines, UNITS_PER_PIXEL))
+
+
+def line_frame(line_number, color, width):
+    color = color.encode('utf-8')
+    return frame(FRAME_LINE, struct.pack('<IfB', line_number, width, len(color)) + color)
+
+
+def points_frame(line_number, coords, bounds=None):
+    """
+    encodes coords of shape [n, 3] (x, y, pen up) as delta encoded int16 points, clamping them
+    inside bounds ((min_x, min_y), (max_x, max_y)) first if given
+    """
+    xy = coords[:, :2]
+    if bounds is not None:
+        xy = np.clip(xy, bounds[0], bounds[1])
+    points = np.round(xy * UNITS_PER_PIXEL).astype(np.int64)
+    deltas = np.diff(points, axis=0)
+    if len(deltas) and np.abs(deltas).max() > INT16_MAX:
+        raise ValueError(f"Point deltas exceed the int16 range; the view must be under {INT16_MAX // UNITS_PER_PIXEL} pixels")
+
+    pen_up = np.packbits(coords[:, 2] == 1)
+    header = struct.pack('<IIii', line_number, len(points), points[0, 0], points[0, 1])
+    return frame(FRAME_POINTS, header + deltas.astype('<i2').tobytes() + pen_up.tobytes())
+
+
+def error_frame(message):
+    return frame(FRAME_ERROR, message.encode('utf-8'))
+
+
+def done_frame():
+    return frame(FRAME_DONE)
@@ -1,5 +1,8 @@
 import tensorflow as tf
 
+# 2**31 - 1: the product of two residues fits in an int64, and x -> x**5 is a bijection modulo it
+HASH_MODULUS = 2147483647
+
 
 def dense_layer(inputs, output_units, bias=True, activation=None, batch_norm=None,
                 dropout=None, scope='dense-layer', reuse=False):
@@ -77,6 +80,32 @@ def time_distributed_dense_layer(
         return z
 
 
+def hash_uniform(seeds, counters, rounds=3):
+    """
+    Counter-based uniform samples in (0, 1).  Sample [i, j] is a fixed function of seeds[i] and
+    counters[j] alone, so a row draws the same values whatever else is in its batch.
+
+    Args:
+        seeds: int64 tensor of shape [batch size].
+        counters: int64 tensor of shape [num samples].
+        rounds: Number of mixing rounds applied to the seed and to the seed/counter pair.
+
+    Returns:
+        float32 tensor of shape [batch size, num samples].
+    """
+    def mix(x):
+        for _ in range(rounds):
+            x2 = tf.floormod(x*x, HASH_MODULUS)
+            x = tf.floormod(tf.floormod(x2*x2, HASH_MODULUS)*x, HASH_MODULUS)
+            x = tf.floormod(x*48271 + 12345, HASH_MODULUS)
+        return x
+
+    x = mix(tf.floormod(tf.expand_dims(seeds, 1), HASH_MODULUS))
+    x = mix(tf.floormod(x + tf.expand_dims(counters, 0), HASH_MODULUS))
+    u = (tf.cast(x, tf.float64) + 0.5) / HASH_MODULUS
+    return tf.clip_by_value(tf.cast(u, tf.float32), 1e-7, 1.0 - 1e-7)
+
+
 def shape(tensor, dim=None):
     """Get tensor shape/dimension as list/int"""
     if dim is None:
@@ -1,7 +1,9 @@
 import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routes import router as handwriting_router
+from app.routes import router as handwriting_router, DOCUMENT_HANDLE_HEADER
+from app.websocket import router as session_router
+from app.jobs import router as jobs_router
 from dotenv import load_dotenv
 import os
 
@@ -28,6 +30,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=allow_methods,
     allow_headers=allow_headers,
+    expose_headers=[DOCUMENT_HANDLE_HEADER],
 )
 
 app.include_router(handwriting_router, prefix="/handwriting")
+app.include_router(session_router, prefix="/handwriting")
+app.include_router(jobs_router, prefix="/handwriting")
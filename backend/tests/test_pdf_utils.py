@@ -0,0 +1,35 @@
+import io
+import zlib
+
+import numpy as np
+
+from handwriting.utils import pdf_utils
+
+
+def _page_content(pdf):
+    stream = pdf.split(b'stream\n', 1)[1].split(b'\nendstream', 1)[0]
+    return zlib.decompress(stream).decode('ascii')
+
+
+def _write_line(color):
+    output = io.BytesIO()
+    writer = pdf_utils.PDFWriter(output)
+    writer.begin_page(100, 100)
+    writer.draw_strokes(np.array([[10.0, 20.0, 0.0], [90.0, 20.0, 1.0]]), color, 2)
+    writer.save()
+    return output.getvalue()
+
+
+def test_shorthand_hex_color_expands_like_css():
+    content = _page_content(_write_line('#abc'))
+    assert '0.6667 0.7333 0.8000 RG' in content
+
+
+def test_translucent_color_sets_stroke_alpha():
+    pdf = _write_line('rgba(255, 0, 0, 0.5)')
+    assert '/GS0 gs 1.0000 0.0000 0.0000 RG' in _page_content(pdf)
+    assert b'/ExtGState << /GS0 << /CA 0.5000 >> >>' in pdf
+
+
+def test_transparent_color_draws_nothing():
+    assert ' RG ' not in _page_content(_write_line('transparent'))
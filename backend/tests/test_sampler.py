@@ -0,0 +1,44 @@
+import types
+
+import numpy as np
+import pytest
+
+pytest.importorskip("tensorflow")
+
+import handwriting.sampler as sampler_module
+from handwriting.sampler import StrokeSampler
+
+
+class _RecordingSession:
+    def __init__(self):
+        self.feed_dict = None
+
+    def run(self, fetches, feed_dict):
+        self.feed_dict = feed_dict
+        num_samples = feed_dict[sampler_nn.num_samples]
+        return [np.ones([num_samples, 4, 3], dtype=np.float32)]
+
+
+sampler_nn = types.SimpleNamespace(**{
+    name: name for name in (
+        "num_samples", "sample_tsteps", "c", "c_len", "bias", "seeds",
+        "prime", "x_prime", "x_prime_len", "sampled_sequence",
+    )
+})
+
+
+def test_unprimed_sample_feeds_prime_placeholders(monkeypatch):
+    monkeypatch.setitem(sampler_module.SAMPLING_CONFIG, "compact_finished_rows", False)
+    sampler = StrokeSampler.__new__(StrokeSampler)
+    sampler.logger = None
+    sampler.nn = types.SimpleNamespace(**vars(sampler_nn), session=_RecordingSession())
+    sampler._run = lambda fetches, feed_dict: sampler.nn.session.run(fetches, feed_dict)
+
+    samples = sampler.sample(["hello", "hi"], [0.5, 0.5])
+
+    feed_dict = sampler.nn.session.feed_dict
+    assert feed_dict["prime"] is False
+    # tf1 needs the placeholders of the untaken primed branch fed too
+    assert feed_dict["x_prime"].shape == (2, 0, 3)
+    assert feed_dict["x_prime_len"].tolist() == [0, 0]
+    assert len(samples) == 2